@@ -18,200 +18,598 @@ Median Age of the Total Population                                           | D
 Total Population Aged 25 to 34 Years                                         | DP05_0009E	      | 
 Total Population, All Ages						     | DP05_0001E	      | B01003_001E
 
+The mapping between vintages is kept in ACScrosswalk.csv, and getACSPanel uses it to fetch
+indicators across a range of years, e.g. getACSPanel(['MHHI', 'MedianAge'], 'msa', 2009, 2015).
+
 """
 
-import requests
 import json
+import warnings
+import os
+import re
+import bisect
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sb
+import datarequests
+from geography import crosswalk, us_key
+from multiprocessing.dummy import Pool as ThreadPool
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+class ACSVariableCatalog(object):
+    '''
+    Indexed view of the ACS variable list (series, concept, label). The CSV is only read on first
+    use; a pickled copy of the table and its indexes is kept next to it and rebuilt when the CSV changes.
+    Lookups:
+        - catalog['DP03_0062E']: catalog row for an exact series code
+        - catalog.concept('SELECTED ECONOMIC CHARACTERISTICS'): all series in a concept
+        - catalog.search('median household income'): series whose label has a word starting with each keyword
+        - catalog.under('SEX AND AGE!!Total population'): series at or below a level of the !!-separated label
+        - catalog.missing(['DP03_0062E', ...]): codes in a list that are not in the catalog
+        - catalog.dtypes(['DP03_0062E', ...]): the numeric type each series is returned as
+    '''
+    # Estimates whose labels match are measured in units that are not whole numbers
+    float_labels = re.compile(r'median|mean|average|per capita|ratio|rate|percent', re.I)
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ACSvariables.csv')
+        self.cache_path = os.path.splitext(self.path)[0]+'.pkl'
+        self._index = None
+        
+    def _load(self):
+        if self._index is None:
+            if os.path.exists(self.cache_path) and os.path.getmtime(self.cache_path) >= os.path.getmtime(self.path):
+                try:
+                    with open(self.cache_path, 'rb') as f:
+                        self._index = pickle.load(f)
+                except Exception:
+                    self._index = None
+            if self._index is None:
+                self._index = self._build()
+                try:
+                    with open(self.cache_path, 'wb') as f:
+                        pickle.dump(self._index, f, pickle.HIGHEST_PROTOCOL)
+                except (IOError, OSError):
+                    pass
+        return self._index
+        
+    def _build(self):
+        df = pd.read_csv(self.path, dtype=str).fillna('')
+        df = df.sort_values('series').reset_index(drop=True)
+        
+        concepts, words = {}, {}
+        for i, (concept, label) in enumerate(zip(df.concept, df.label)):
+            concepts.setdefault(concept.upper(), []).append(i)
+            for w in set(re.findall(r"[a-z0-9']+", label.lower())):
+                words.setdefault(w, []).append(i)
+        
+        labels = sorted(zip(df.label.str.lower(), range(len(df))))
+        
+        return {'frame':df, 'codes':dict(zip(df.series, range(len(df)))), 'concepts':concepts,
+                'words':words, 'word_list':sorted(words), 'labels':labels}
+    
+    @property
+    def frame(self):
+        return self._load()['frame']
+    
+    def __contains__(self, code):
+        return code in self._load()['codes']
+        
+    def __getitem__(self, code):
+        ix = self._load()
+        return ix['frame'].iloc[ix['codes'][code]]
+        
+    def _rows(self, positions):
+        return self.frame.iloc[sorted(positions)]
+        
+    def concept(self, concept):
+        return self._rows(self._load()['concepts'].get(concept.upper(), []))
+        
+    def search(self, keywords):
+        '''
+        keywords: string or list of words. Each must prefix-match a word of the label.
+        '''
+        ix = self._load()
+        if isinstance(keywords, string_types):
+            keywords = keywords.split()
+        found = None
+        for k in keywords:
+            k = k.lower()
+            matches = set()
+            i = bisect.bisect_left(ix['word_list'], k)
+            while i < len(ix['word_list']) and ix['word_list'][i].startswith(k):
+                matches.update(ix['words'][ix['word_list'][i]])
+                i += 1
+            found = matches if found is None else found & matches
+        return self._rows(found or [])
+        
+    def under(self, path):
+        '''
+        path: label levels separated by !!, e.g. 'SEX AND AGE!!Total population'
+        '''
+        labels = self._load()['labels']
+        path = path.lower()
+        positions = []
+        i = bisect.bisect_left(labels, (path,))
+        while i < len(labels) and labels[i][0].startswith(path):
+            if labels[i][0] == path or labels[i][0][len(path):].startswith('!!'):
+                positions.append(labels[i][1])
+            i += 1
+        return self._rows(positions)
+        
+    def missing(self, codes):
+        codes_ix = self._load()['codes']
+        return [c for c in codes if c not in codes_ix]
+        
+    def dtypes(self, codes):
+        '''
+        Returns {code: 'Int64' or 'float64'}. Percents (PE) and their margins (PM) are floats. Estimates (E)
+        and margins (M) are counts, held as nullable integers, unless their label in the catalog is for a
+        median, mean, ratio or rate.
+        '''
+        types = {}
+        for code in codes:
+            kind = re.search(r'(PE|PM|E|M)$', code)
+            if kind is None or kind.group(1) in ['PE', 'PM']:
+                types[code] = 'float64'
+            elif code in self and self.float_labels.search(self[code]['label']):
+                types[code] = 'float64'
+            else:
+                types[code] = 'Int64'
+        return types
 
 # See all available variables with series code listed
-acs_var = pd.read_csv(r'G:\Data Center\Scripts\ACSvariables.csv')
+acs_catalog = ACSVariableCatalog()
+
+class _DeprecatedCatalogFrame(object):
+    '''
+    Stands in for the acs_var dataframe of earlier versions, loading the catalog only when used.
+    '''
+    def _frame(self):
+        warnings.warn('acs_var is deprecated and will be removed; use acs_catalog.frame', DeprecationWarning, stacklevel=3)
+        return acs_catalog.frame
+    def __getattr__(self, name):
+        return getattr(self._frame(), name)
+    def __getitem__(self, key):
+        return self._frame()[key]
+    def __len__(self):
+        return len(self._frame())
+    def __iter__(self):
+        return iter(self._frame())
+    def __repr__(self):
+        return repr(self._frame())
+
+# Deprecated: use acs_catalog.frame
+acs_var = _DeprecatedCatalogFrame()
+
+class ACSCrosswalk(object):
+    '''
+    Maps logical indicators to the endpoint and series code that carry them in each survey year,
+    read from ACScrosswalk.csv (indicator, first_year, last_year, endpoint, code, description) on first use.
+    Series codes move between vintages, e.g. median household income is B19013_001E in the detailed
+    tables through 2012 and DP03_0062E in the data profile after. Add a row to extend an indicator to new years.
+    '''
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ACScrosswalk.csv')
+        self._frame = None
+        
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = pd.read_csv(self.path, dtype={'indicator':str, 'endpoint':str, 'code':str, 'description':str})
+        return self._frame
+        
+    @property
+    def indicators(self):
+        return list(self.frame.indicator.unique())
+        
+    def resolve(self, indicators, year):
+        '''
+        Returns {endpoint: {code: indicator}} for the indicators available in a year, and the list of
+        indicators with no code that year.
+        '''
+        df = self.frame
+        df = df[df.indicator.isin(indicators) & (df.first_year <= int(year)) & (df.last_year >= int(year))]
+        codes = {}
+        for indicator, endpoint, code in zip(df.indicator, df.endpoint, df.code):
+            codes.setdefault(endpoint, {})[code] = indicator
+        return codes, [i for i in indicators if i not in set(df.indicator)]
+
+acs_crosswalk = ACSCrosswalk()
 auth_key = ''
-top25 = [12060, 12580, 14460, 16740, 16980, 19100, 19740, 19820, 26420, 31080, # 31080 = LA # Other lists have LA as 31100
-        33100, 33460, 35620, 37980, 38060, 38300, 38900, 40140, 41700, 41740,
-        41860, 41180, 42660, 45300, 47900]
 
-def getACSData(data, geo, year, acs_year_period=5, a_key=auth_key, place='*', state='*', zipcode='*', county='*'):
+# The Census API accepts up to 50 variables in a single get= clause. NAME takes one slot.
+max_vars = 49
+# Census geography headers that are returned under a different name than the geo parameter
+census_geo_names = {'metropolitan statistical area/micropolitan statistical area':'msa',
+                    'combined statistical area':'csa', 'zip code tabulation area':'zipcode'}
+
+# Annotation values the Census API returns in place of an estimate, e.g. -666666666 when too few
+# sample observations were available. They are returned as missing values.
+acs_sentinels = [-999999999, -888888888, -666666666, -555555555, -333333333, -222222222]
+# Digits in each geography code, for building full FIPS keys
+census_geo_widths = {'state':2, 'county':3, 'place':5, 'tract':6, 'msa':5, 'csa':3, 'zipcode':5}
+# Geographies requested one state at a time when several states are asked for
+fan_out_geos = ['county', 'place', 'tract']
+# Number of per-state requests in flight at once. The datarequests rate limit still applies.
+acs_workers = 8
+
+class ACSNoData(ValueError):
     '''
-    parameters:
-        - data: list of data series for which to request information
-        - geo: geography of data requested. 
-        - year: ACS survey year
-        - acs_year_period: 1-year or 5-year survey
-        - a_key: ACS authorization key
-        - place: optional parameter to call information for specific place
-            If a place is specified, a state must be specified along with it.
-        - state: optional parameter to call information for specific state, or for places, counties, and MSAs within a state
-        - zipcode: optional parameter to call information for a specific ZIP code
-        - county: optional parameter to call information for specific county
-            County code must be passed as string to maintain placeholder 0s.
+    Raised when the Census API answers a call with an empty body, as it does for geographies or surveys it has no data for.
+    '''
+
+def _chunks(seq, n):
+    '''
+    Splits a list into consecutive pieces of at most n items.
+    '''
+    return [seq[i:i+n] for i in range(0, len(seq), n)]
+
+def _acsArea(geo, place='*', state='*', zipcode='*', county='*'):
+    '''
+    Builds the for= (and in=) clause of a Census API call for a geography.
     '''
     if type(county) != str:
         print 'County parameter must be passed as string to maintain placeholder 0s.'
-    else:
-        pass
     
-    acs_dict = {1:'acs1', 5:'acs5'}
     geo_dict = {'state':'state:{}'.format(state), 'msa':'metropolitan statistical area/micropolitan statistical area:*',
                 'us':'us:*', 'csa':'combined statistical area:*', 'county':'county:{}'.format(county),
-                'place':'place:{}'.format(place), 'zipcode':str(zipcode)}
+                'place':'place:{}'.format(place), 'tract':'tract:*', 'zipcode':'zip code tabulation area:'+_zipList(zipcode)}
+    if geo == 'tract':
+        return geo_dict[geo]+'&in=state:{}+county:{}'.format(state, county)
     if geo not in ['zipcode', 'us']:
-        area = geo_dict[geo]+'&in=state:{}'.format(state)
+        return geo_dict[geo]+'&in=state:{}'.format(state)
+    return geo_dict[geo]
+
+def _zipList(zipcode):
+    '''
+    Normalizes ZIP codes for the for= clause: a single code, a comma-separated string or a list of codes,
+    given as strings or integers and with or without a ZIP+4 suffix, become five-digit codes joined by commas.
+    '''
+    if isinstance(zipcode, (list, tuple, set)):
+        codes = list(zipcode)
     else:
-        area = geo_dict[geo]
-        
-    dataframes = []           
-    for s in data:
-        p = requests.get('http://api.census.gov/data/'+str(year)+'/'+str(acs_dict[acs_year_period])+'/profile?get=NAME,'+s+'&for='+area+'&key='+a_key)
-        json_data = json.loads(p.text)
-    
-        df = pd.DataFrame(json_data)
-        df.rename(columns={0:df[0].loc[0], 1:df[1].loc[0], 2:geo}, inplace=True)
-        df.drop(0, inplace=True)
-        
-        df['{}'.format(s)] = df['{}'.format(s)]#.astype(float)
-        df[geo] = df[geo].astype(int)
+        codes = str(zipcode).replace('zip code tabulation area:', '').split(',')
+    codes = [str(z).strip().split('-')[0] for z in codes]
+    return ','.join(z if z == '*' else z.zfill(5) for z in codes)
+
+def _acsStates(state):
+    '''
+    Expands a state argument to two-digit state FIPS codes. '*' is every state, DC and Puerto Rico.
+    '''
+    if state == '*':
+        return [str(s).zfill(2) for s in crosswalk.index('state').index]
+    if isinstance(state, (list, tuple, set)):
+        return [str(s).zfill(2) for s in state]
+    return [str(state).zfill(2)]
+
+def _fipsKeys(df, keys):
+    '''
+    Builds full FIPS codes by joining zero-padded geography code columns, e.g. state and county.
+    '''
+    fips = pd.Series('', index=df.index)
+    for k in keys:
+        fips = fips+df[k].astype(str).str.zfill(census_geo_widths.get(k, 0))
+    return fips
+
+def _fetchACS(url, data, geo, area, a_key, name_first=True, cache='ttl', fetcher='getACSData'):
+    '''
+    Requests the series in data from a Census endpoint, packing as many series as the API
+    allows into each call. Returns one dataframe per call.
+        parameters:
+            - url: Census dataset endpoint, e.g. http://api.census.gov/data/2014/acs5/profile
+            - data: list of data series
+            - geo: geography of data requested
+            - area: for= clause built by _acsArea
+            - a_key: ACS authorization key
+            - name_first: whether NAME leads the get= clause (profile) or follows the series (detailed tables)
+            - cache: response cache mode, see datarequests
+            - fetcher: name stage timings are reported under, see datarequests instrumentation
+    '''
+    dataframes = []
+    for chunk in _chunks(list(data), max_vars):
+        get = ['NAME']+chunk if name_first else chunk+['NAME']
+        with datarequests.stage('census', fetcher, 'fetch'):
+            p = datarequests.get('census', url+'?get='+','.join(get)+'&for='+area+'&key='+a_key, mode=cache)
         
-        df = df.reset_index(drop=True)
+        with datarequests.stage('census', fetcher, 'parse'):
+            try:
+                json_data = json.loads(p.text)
+            except ValueError:
+                raise ACSNoData('No data from {}'.format(url+'?for='+area))
+            
+            # First row of the response holds the column headers
+            df = pd.DataFrame(json_data[1:], columns=json_data[0])
+            df.rename(columns=census_geo_names, inplace=True)
+            df[geo] = df[geo].astype(int)
+            
+            # Index on the geography columns (e.g. state and county) so calls can be aligned later
+            df.set_index([c for c in df.columns if c not in chunk and c != 'NAME'], inplace=True)
         
         dataframes.append(df)
-            
-    df = dataframes[0]
-    for d in dataframes[1:]:
-        df = pd.merge(df, d, on='NAME', how='left', suffixes=['', '_r'])
-        #df.drop('NAME_r', inplace=True, axis=1)
         
-    df = df.reset_index(drop=True)
-    ix = np.in1d(np.array(df[geo]).ravel(), top25).reshape(df[geo].shape)
-    df['top25'] = np.where(ix, 1, 0)
+    return dataframes
+
+def _fetchAreas(url, data, geo, a_key, place='*', state='*', zipcode='*', county='*', name_first=True, cache='ttl', fetcher='getACSData'):
+    '''
+    Fetches the series for a geography. Counties, places and tracts in every state ('*') or a list of states
+    are requested one state at a time, acs_workers at once, and each call's pieces are stacked.
+    Returns one dataframe per call, as _fetchACS does.
+    '''
+    if geo not in fan_out_geos or not (state == '*' or isinstance(state, (list, tuple, set))):
+        return _fetchACS(url, data, geo, _acsArea(geo, place, state, zipcode, county), a_key, name_first, cache, fetcher)
     
+    def fetchState(s):
+        try:
+            return _fetchACS(url, data, geo, _acsArea(geo, place, s, zipcode, county), a_key, name_first, cache, fetcher)
+        except ACSNoData:
+            # The Census API answers with an empty body when a state has no geographies of this type
+            print 'No {geo} data for state {state}'.format(geo=geo, state=s)
+            return None
+    
+    states = _acsStates(state)
+    pool = ThreadPool(max(1, min(acs_workers, len(states))))
+    try:
+        pieces = [p for p in pool.map(fetchState, states) if p is not None]
+    finally:
+        pool.close()
+    if not pieces:
+        raise ACSNoData('No {} data for any of the states requested'.format(geo))
+    
+    return [pd.concat(parts) for parts in zip(*pieces)]
+
+def _acsNumeric(values):
+    '''
+    Converts API values to a float array in one pass, with annotation sentinels as NaN.
+    '''
+    values = pd.to_numeric(pd.Series(np.asarray(values, dtype=object).ravel()), errors='coerce').values.astype(float)
+    values[np.isin(values, acs_sentinels)] = np.nan
+    return values
+
+def _typeACSFrame(df, variables, keys, float32=False):
+    '''
+    Types an assembled frame: every series column is converted in one pass, then held as nullable integers
+    or floats according to acs_catalog.dtypes; numeric geography codes become integers; NAME, fips and any
+    other geography keys become categorical.
+    With float32=True, float columns are held as float32.
+    '''
+    values = _acsNumeric(df[variables].values).reshape(len(df), len(variables))
+    types = acs_catalog.dtypes(variables)
+    for i, v in enumerate(variables):
+        column = values[:, i]
+        known = column[~np.isnan(column)]
+        # Counts that turn out not to be whole numbers are kept as floats rather than rounded
+        if types[v] == 'Int64' and np.array_equal(known, np.round(known)):
+            df[v] = pd.array(column, dtype='Int64')
+        else:
+            df[v] = column.astype(np.float32 if float32 else np.float64)
+    
+    for k in keys:
+        codes = pd.to_numeric(df[k], errors='coerce') if k != 'fips' else None
+        # Keys that are not all numeric codes, such as a wildcard echoed back, stay as labels
+        if codes is not None and codes.notnull().all():
+            df[k] = codes.astype(int)
+        else:
+            df[k] = df[k].astype('category')
+    df['NAME'] = df.NAME.astype('category')
     return df
+
+def _assembleACS(dataframes, geo, shape='wide', float32=False):
+    '''
+    Combines the per-call dataframes returned by _fetchACS into a single typed dataframe,
+    aligning every call once on the geography codes.
+        parameters:
+            - dataframes: list of dataframes indexed on geography codes
+            - geo: geography of data requested
+            - shape: 'wide' for one column per series, or 'long' for one row per geography and series
+            - float32: hold float series as float32 to halve their memory
+    '''
+    df = pd.concat([dataframes[0]]+[d.drop('NAME', axis=1) for d in dataframes[1:]], axis=1)
+    keys = list(df.index.names)
+    variables = [c for c in df.columns if c != 'NAME']
+    df = df.reset_index()
+    
+    # Geographies nested in states (counties, places, tracts) are keyed by their full FIPS code
+    if len(keys) > 1:
+        df['fips'] = _fipsKeys(df, keys)
+        keys.append('fips')
+    df = _typeACSFrame(df, variables, keys, float32)
+    
+    # Peer group membership is looked up on the CBSA code
+    df['top25'] = np.where(df[geo].isin(crosswalk.peerGroup('top25')) if geo == 'msa' else False, 1, 0)
     
-def getACSData10(data, geo, year, acs_year_period=5, a_key=auth_key, place='*', state='*', zipcode='*', county='*'):
+    if shape == 'long':
+        # Series of different types share the value column, so it is held as float
+        df[variables] = df[variables].astype(np.float32 if float32 else np.float64)
+        df = pd.melt(df, id_vars=keys+['NAME', 'top25'], var_name='variable', value_name='value')
+        df['variable'] = df.variable.astype('category')
+    elif shape != 'wide':
+        print 'Shape must be either wide or long.'
+    
+    # Keep the geography name first, as in the API response
+    return df[['NAME']+[c for c in df.columns if c != 'NAME']]
+
+def _warehouseACS(dataframes, year):
+    '''
+    Reshapes the per-call dataframes from _fetchACS to the warehouse layout. The geography key is
+    the geography codes joined in order, e.g. state and county FIPS make a five-digit county FIPS.
+    '''
+    df = pd.concat([d.drop('NAME', axis=1) for d in dataframes], axis=1)
+    keys = list(df.index.names)
+    df = df.reset_index()
+    geo = pd.Series(us_key, index=df.index) if keys == ['us'] else _fipsKeys(df, keys)
+    df = df.drop(keys, axis=1).set_index(geo)
+    df = df.stack().reset_index()
+    df.columns = ['geo', 'series', 'value']
+    df['value'] = _acsNumeric(df.value)
+    df['period'] = int(year)
+    return df
+
+# Census API tables: the path after the survey, and whether NAME leads the get= clause
+acs_endpoints = {'profile':{'path':'/profile', 'name_first':True}, 'detailed':{'path':'', 'name_first':False}}
+
+def getACS(data, geo, year, endpoint='profile', acs_year_period=5, a_key=auth_key, place='*', state='*', zipcode='*', county='*', shape='wide', cache='ttl', store=None, float32=False):
     '''
     parameters:
         - data: list of data series for which to request information
-        - geo: geography of data requested. 
+            Up to 49 series are requested per call; longer lists are split over several calls.
+        - geo: geography of data requested: 'us', 'state', 'msa', 'csa', 'county', 'place', 'tract' or 'zipcode'
         - year: ACS survey year
+        - endpoint: 'profile' for the data profile tables (DP series) or 'detailed' for the detailed tables (B and C series)
         - acs_year_period: 1-year or 5-year survey
         - a_key: ACS authorization key
         - place: optional parameter to call information for specific place
             If a place is specified, a state must be specified along with it.
         - state: optional parameter to call information for specific state, or for places, counties, and MSAs within a state
-        - zipcode: optional parameter to call information for a specific ZIP code
+            For counties, places and tracts, '*' (all states) or a list of state FIPS codes fans out into one request per state,
+            sent concurrently. Counties, places and tracts are keyed by their full FIPS code in a fips column.
+        - zipcode: optional parameter to call information for a specific ZIP code, or a list of ZIP codes
         - county: optional parameter to call information for specific county
             County code must be passed as string to maintain placeholder 0s.
+        - shape: 'wide' returns one column per series; 'long' returns variable and value columns
+        - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+        - store: optional warehouse.Warehouse to also write the data into
+        - float32: hold float series as float32 to halve their memory
+    Series are returned typed, as set out by acs_catalog.dtypes: counts as nullable integers, and percents,
+    medians and rates as floats. Census annotation values such as -666666666 become missing values.
     '''
-    if type(county) != str:
-        print 'County parameter must be passed as string to maintain placeholder 0s.'
-    else:
-        pass
-    
     acs_dict = {1:'acs1', 5:'acs5'}
-    geo_dict = {'state':'state:{}'.format(state), 'msa':'metropolitan statistical area/micropolitan statistical area:*',
-                'us':'us:*', 'csa':'combined statistical area:*', 'county':'county:{}'.format(county),
-                'place':'place:{}'.format(place), 'zipcode':str(zipcode)}
-    if geo not in ['zipcode', 'us']:
-        area = geo_dict[geo]+'&in=state:{}'.format(state)
-    else:
-        area = geo_dict[geo]
-        
-    dataframes = []           
-    for s in data:
-        p = requests.get('http://api.census.gov/data/'+str(year)+'/'+str(acs_dict[acs_year_period])+'?key={key}&get={s},NAME&for={area}'.format(key=auth_key, s=s, area=area))
-        json_data = json.loads(p.text)
     
-        df = pd.DataFrame(json_data)
-        df.rename(columns={0:df[0].loc[0], 1:df[1].loc[0], 2:geo}, inplace=True)
-        df.drop(0, inplace=True)
-        
-        df['{}'.format(s)] = df['{}'.format(s)]#.astype(float)
-        df[geo] = df[geo].astype(int)
-        
-        df = df.reset_index(drop=True)
-        
-        dataframes.append(df)
-            
-    df = dataframes[0]
-    for d in dataframes[1:]:
-        df = pd.merge(df, d, on='NAME', how='left', suffixes=['', '_r'])
-        #df.drop('NAME_r', inplace=True, axis=1)
-        
-    df = df.reset_index(drop=True)
-    ix = np.in1d(np.array(df[geo]).ravel(), top25).reshape(df[geo].shape)
-    df['top25'] = np.where(ix, 1, 0)
+    dataframes = _fetchAreas('http://api.census.gov/data/'+str(year)+'/'+str(acs_dict[acs_year_period])+acs_endpoints[endpoint]['path'],
+                             data, geo, a_key, place, state, zipcode, county, name_first=acs_endpoints[endpoint]['name_first'],
+                             cache=cache, fetcher='getACS')
+    if store is not None:
+        store.write(_warehouseACS(dataframes, year), 'census')
     
-    return df
+    with datarequests.stage('census', 'getACS', 'assemble'):
+        return _assembleACS(dataframes, geo, shape, float32)
+
+def getACSData(data, geo, year, acs_year_period=5, a_key=auth_key, place='*', state='*', zipcode='*', county='*', shape='wide', cache='ttl', store=None, float32=False):
+    '''
+    Requests data profile series (e.g. DP03_0062E). Parameters are as for getACS.
+    '''
+    return getACS(data, geo, year, 'profile', acs_year_period, a_key, place, state, zipcode, county, shape, cache, store, float32)
+    
+def getACSData10(data, geo, year, acs_year_period=5, a_key=auth_key, place='*', state='*', zipcode='*', county='*', shape='wide', cache='ttl', store=None, float32=False):
+    '''
+    Requests detailed table series (e.g. B19013_001E), as used for 2010. Parameters are as for getACS.
+    '''
+    return getACS(data, geo, year, 'detailed', acs_year_period, a_key, place, state, zipcode, county, shape, cache, store, float32)
     
 # Example: df = getACSData(['DP02_0065PE'], 'msa', 2013, 5)
 
-''' For rapid EAGB use '''
-
-def getEdAttainRank(year, year_series):
-    df = getACSData(['DP02_0065PE', 'DP02_0067PE'], 'msa', year, year_series)
-    top25 = [12060, 12580, 14460, 16740, 16980, 19100, 19740, 19820, 26420, 31080, # 31080 = LA # Other lists have LA as 31100
-             33100, 33460, 35620, 37980, 38060, 38300, 38900, 40140, 41700, 41740,
-             41860, 41180, 42660, 45300, 47900]
-    ix = np.in1d(np.array(df.msa).ravel(), top25).reshape(df.msa.shape)
-    df['top25'] = np.where(ix, 1, 0)
-        
-    # Get US average too
-    df_us = getACSData(['DP02_0065PE', 'DP02_0067PE'], 'us', year, year_series)
-    df_us.rename(columns={'us':'msa'}, inplace=True)
-    df_us['top25'] = 1
+def getACSPanel(indicators, geo, first_year, last_year, acs_year_period=5, a_key=auth_key, place='*', state='*', zipcode='*', county='*', workers=None, cache='ttl', float32=False):
+    '''
+    Builds a multi-year panel of indicators. Each year is resolved through acs_crosswalk to the endpoints
+    and series codes that carry the indicators that year, and every (year, endpoint) call is sent at once.
+    Returns one long dataframe with the geography columns, year, indicator, code and value.
+    parameters:
+        - indicators: list of indicator names from ACScrosswalk.csv, e.g. ['MHHI', 'MedianAge']
+        - geo: geography of data requested, as for getACS
+        - first_year, last_year: first and last ACS survey years, inclusive
+        - acs_year_period: 1-year or 5-year survey
+        - a_key: ACS authorization key
+        - place, state, zipcode, county: as for getACS
+        - workers: number of calls sent at once. Defaults to acs_workers.
+        - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+        - float32: hold values as float32 to halve their memory
+    Years in which an indicator has no code in the crosswalk are skipped for that indicator, with a message.
+    '''
+    unknown = [i for i in indicators if i not in acs_crosswalk.indicators]
+    if unknown:
+        raise ValueError('Indicators not in the ACS crosswalk: {}'.format(', '.join(unknown)))
     
-    # Append US to MSAs
-    df = df.append(df_us)
+    calls = []
+    for year in range(int(first_year), int(last_year)+1):
+        codes, unmapped = acs_crosswalk.resolve(indicators, year)
+        if unmapped:
+            print 'No ACS series for {indicators} in {year}'.format(indicators=', '.join(unmapped), year=year)
+        calls += [(year, endpoint, codes[endpoint]) for endpoint in sorted(codes)]
+    if not calls:
+        raise ValueError('No ACS series for {} from {} to {}'.format(', '.join(indicators), first_year, last_year))
     
-    df = df[df.top25==1]
-    df = df.sort('DP02_0065PE')
-    df = df.reset_index(drop=True) # Sorted by % with grad or professional degree
+    def fetchYear(call):
+        year, endpoint, codes = call
+        try:
+            df = getACS(sorted(codes), geo, year, endpoint, acs_year_period, a_key, place, state, zipcode, county,
+                        shape='long', cache=cache, float32=float32)
+        except ACSNoData:
+            # The Census API answers with an empty body for surveys it has not published
+            print 'No {endpoint} data for {year}'.format(endpoint=endpoint, year=year)
+            return None
+        df['variable'] = df.variable.astype(str)
+        df['indicator'] = df.variable.map(codes)
+        df['year'] = year
+        return df.rename(columns={'variable':'code'})
     
-    return df
+    pool = ThreadPool(max(1, min(workers or acs_workers, len(calls))))
+    try:
+        pieces = [p for p in pool.map(fetchYear, calls) if p is not None]
+    finally:
+        pool.close()
+    if not pieces:
+        raise ValueError('No ACS data returned from {} to {}'.format(first_year, last_year))
     
-def getMHHI(year, year_series):
-    df = getACSData(['DP03_0062E'], 'msa', year, year_series)
-    top25 = [12060, 12580, 14460, 16740, 16980, 19100, 19740, 19820, 26420, 31080, # 31080 = LA # Other lists have LA as 31100
-             33100, 33460, 35620, 37980, 38060, 38300, 38900, 40140, 41700, 41740,
-             41860, 41180, 42660, 45300, 47900]
-    ix = np.in1d(np.array(df.msa).ravel(), top25).reshape(df.msa.shape)
-    df['top25'] = np.where(ix, 1, 0)
-        
-    # Get US average too
-    df_us = getACSData(['DP03_0062E'], 'us', year, year_series)
-    df_us.rename(columns={'us':'msa'}, inplace=True)
-    df_us['top25'] = 1
+    with datarequests.stage('census', 'getACSPanel', 'assemble'):
+        df = pd.concat(pieces, ignore_index=True)
+        keys = [c for c in df.columns if c not in ['NAME', 'top25', 'year', 'indicator', 'code', 'value']]
+        for c in ['NAME', 'indicator', 'code']:
+            df[c] = df[c].astype('category')
+        df = df.sort_values(keys+['year', 'indicator']).reset_index(drop=True)
+        return df[['NAME']+keys+['top25', 'year', 'indicator', 'code', 'value']]
+
+''' For rapid EAGB use '''
+
+# Indicators for the EAGB tables: the series each needs, and the series its table is sorted by
+acs_indicators = {'EdAttain':{'series':['DP02_0065PE', 'DP02_0067PE'], 'sort':'DP02_0065PE'}, # Sorted by % with grad or professional degree
+                  'MHHI':{'series':['DP03_0062E'], 'sort':'DP03_0062E'},
+                  'MedianAge':{'series':['DP05_0017E'], 'sort':'DP05_0017E'}}
+
+def getIndicators(indicators, year, year_series):
+    '''
+    Fetches every series needed by a list of indicators for MSAs and the US at once, then builds
+    each indicator's table of the top 25 MSAs and the US from the one combined frame.
+    Returns a dictionary of {indicator: dataframe}.
+    parameters:
+        - indicators: list of names from acs_indicators, e.g. ['EdAttain', 'MHHI', 'MedianAge']
+        - year: ACS survey year
+        - year_series: 1-year or 5-year survey
+    '''
+    series = []
+    for i in indicators:
+        series += [s for s in acs_indicators[i]['series'] if s not in series]
     
-    # Append US to MSAs
-    df = df.append(df_us)
+    # MSA and US requests go out together
+    pool = ThreadPool(2)
+    try:
+        df, df_us = pool.map(lambda geo: getACSData(series, geo, year, year_series), ['msa', 'us'])
+    finally:
+        pool.close()
     
-    df = df[df.top25==1]
-    df = df.sort('DP03_0062E')
-    df = df.reset_index(drop=True) # Sorted by % with grad or professional degree
+    with datarequests.stage('census', 'getIndicators', 'assemble'):
+        df_us.rename(columns={'us':'msa'}, inplace=True)
+        df_us['top25'] = 1
+        
+        # Append US to MSAs
+        df = pd.concat([df[df.top25==1], df_us], ignore_index=True)
+        
+        tables = {}
+        for i in indicators:
+            columns = ['NAME', 'msa']+acs_indicators[i]['series']+['top25']
+            tables[i] = df[columns].sort_values(acs_indicators[i]['sort']).reset_index(drop=True)
     
-    return df
+    return tables
+
+def getEdAttainRank(year, year_series):
+    return getIndicators(['EdAttain'], year, year_series)['EdAttain']
+    
+def getMHHI(year, year_series):
+    return getIndicators(['MHHI'], year, year_series)['MHHI']
     
 def getMedianAge(year, year_series):
-    df = getACSData(['DP05_0017E'], 'msa', year, year_series)
-    top25 = [12060, 12580, 14460, 16740, 16980, 19100, 19740, 19820, 26420, 31080, # 31080 = LA # Other lists have LA as 31100
-             33100, 33460, 35620, 37980, 38060, 38300, 38900, 40140, 41700, 41740,
-             41860, 41180, 42660, 45300, 47900]
-    ix = np.in1d(np.array(df.msa).ravel(), top25).reshape(df.msa.shape)
-    df['top25'] = np.where(ix, 1, 0)
-        
-    # Get US average too
-    df_us = getACSData(['DP05_0017E'], 'us', year, year_series)
-    df_us.rename(columns={'us':'msa'}, inplace=True)
-    df_us['top25'] = 1
-    
-    # Append US to MSAs
-    df = df.append(df_us)
-    
-    df = df[df.top25==1]
-    df = df.sort('DP05_0017E')
-    df = df.reset_index(drop=True) # Sorted by % with grad or professional degree
-    
-    return df
\ No newline at end of file
+    return getIndicators(['MedianAge'], year, year_series)['MedianAge']
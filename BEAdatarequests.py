@@ -5,111 +5,234 @@ Created on Fri Aug 28 11:05:16 2015
 @author: pdougherty
 """
 
-import requests
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
+import datarequests
+from growth import getGrowth
+from geography import crosswalk, us_key
+from multiprocessing.dummy import Pool as ThreadPool
 
 BEA_key = ''
+# Define the fan favorites
+keycode_dict = {'GMP':'GDP_MP', 'rGMP':'RGDP_MP', 'per capita rGMP':'PCRGDP_MP',
+                'PCI':'PCPI_MI', 'rPCI':'RPCPI_MI'}
+# Number of BEA requests in flight at once. Requests are also held to datarequests.rate_limits['bea'].
+bea_workers = 4
 
-def getBEAData(dataset, keycode=None, table_id=None, freq='A', geo='MSA', first_year=1990, last_year=2014, fmt='json'):
+def _beaSucceeded(response):
+    '''
+    BEA reports request errors in the body of a successful response. Only keep responses with data.
+    '''
+    try:
+        return 'Data' in response.json()['BEAAPI']['Results']
+    except (ValueError, KeyError, TypeError):
+        return False
+
+def parseTimePeriod(periods):
+    '''
+    Converts BEA TimePeriod strings to dates: '2014' (annual), '2014Q2' (quarterly, first month of the quarter)
+    and '2014M03' (monthly). Works on a whole column at once.
+    '''
+    periods = pd.Series(periods).astype(str)
+    year = periods.str[:4].astype(int)
+    kind = periods.str[4:5]
+    num = pd.to_numeric(periods.str[5:], errors='coerce').fillna(1).astype(int)
+    month = np.where(kind=='Q', (num-1)*3+1, np.where(kind=='M', num, 1))
+    return pd.to_datetime(year*10000+month*100+1, format='%Y%m%d')
+
+def _typeBEAFrame(df):
+    '''
+    Parses TimePeriod and DataValue, and adds Region and State to regional data.
+    '''
+    df['TimePeriod'] = parseTimePeriod(df.TimePeriod).values
+    
+    # Change data type to float and int where necessary
+    # NIPA values have thousands separators, and suppressed regional values are reported as (NA) or (D)
+    df['DataValue'] = pd.to_numeric(df.DataValue.astype(str).str.replace(',', ''), errors='coerce')
+    if 'GeoFips' not in df.columns:
+        return df
+    # Batches mixing NIPA and regional data have no GeoFips on the NIPA rows
+    geofips = pd.to_numeric(df.GeoFips, errors='coerce')
+    df['GeoFips'] = geofips.astype(int) if geofips.notnull().all() else geofips.astype('Int64')
+    
+    # Region is named for the principal city in the MSA and State is its postal abbreviation,
+    # both taken from the geography crosswalk by GeoFips (the CBSA code for MSAs).
+    # For example, "Baltimore-Columbia-Towson, MD" is listed as "Baltimore."
+    df = crosswalk.join(df, on='GeoFips', fields=['principal_city', 'state']).rename(columns={'principal_city':'Region', 'state':'State'})
+    # Geographies not in the crosswalk fall back to cleaning GeoName, once per distinct name.
+    # NIPA rows in a mixed batch have no GeoName and are left without a Region.
+    missing = df.Region.isnull() & (df.GeoName.notnull() if 'GeoName' in df.columns else False)
+    if missing.any():
+        names = pd.Series(df.GeoName[missing].unique())
+        region = dict(zip(names, names.str.split('-').str.get(0).str.split(',').str.get(0)))
+        state = dict(zip(names, names.str.split(',').str.get(1).str.split(' ').str.get(1)))
+        for c, lookup in [('Region', region), ('State', state)]:
+            df[c] = df[c].astype(object)
+            df.loc[missing, c] = df.GeoName[missing].map(lookup)
+    
+    return df
+
+def _warehouseBEA(df, series, freq):
+    '''
+    Reshapes BEA data to the warehouse layout. Regional data is keyed by GeoFips, with states (XX000)
+    as two-digit FIPS, and NIPA lines are stored as series <table>/<line>/<frequency> for the US.
+    '''
+    series = series.astype(str)
+    if 'LineNumber' in df.columns:
+        series = series.where(df.LineNumber.isnull(), series+'/'+df.LineNumber.astype(str)+'/'+freq.astype(str))
+    fips = pd.Series(pd.to_numeric(df.GeoFips, errors='coerce') if 'GeoFips' in df.columns else np.nan, index=df.index)
+    fips = fips.fillna(0).astype(int)
+    geo = (fips//1000).astype(str).str.zfill(len(us_key)).where(fips%1000==0, fips.astype(str).str.zfill(5))
+    return pd.DataFrame({'series':series, 'geo':geo, 'period':df.TimePeriod, 'value':df.DataValue})
+
+def getBEAData(dataset, keycode=None, table_id=None, freq='A', geo='MSA', first_year=1990, last_year=2014, fmt='json', cache='ttl', store=None):
     '''
     params:
         - user_key: BEA-supplied user identification API key
         - dataset: BEA dataset request. Reference: http://bea.gov/API/bea_web_service_api_user_guide.htm
-        - keycode: dataset within data parent. May be from short list defined below, or from the list of accepted KeyCodes. Reference: http://bea.gov/API/bea_web_service_api_user_guide.htm
+        - keycode: dataset within data parent. May be from the short list in keycode_dict, or from the list of accepted KeyCodes. Reference: http://bea.gov/API/bea_web_service_api_user_guide.htm
         - table_id: National data only. Standard NIPA table identifier.
         - freq: National data only. {'A':'Annual', 'Q':'Quarterly', 'M':'Monthly}
         - first_year: National data only. First year of data to retrieve
 	- last_year: National data only. Last year of data to retrieve
         - fmt: Result format. Defaults to JSON, but also accepts XML.
+        - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+        - store: optional warehouse.Warehouse to also write the data into
     '''
     
-    # Define the fan favorites
-    keycode_dict = {'GMP':'GDP_MP', 'rGMP':'RGDP_MP', 'per capita rGMP':'PCRGDP_MP',
-                    'PCI':'PCPI_MI', 'rPCI':'RPCPI_MI'}
     if keycode in keycode_dict.keys():
         keycode = keycode_dict[keycode]
     
     # Make GET request of BEA API
-    if dataset=='RegionalData':
-        p = requests.get('http://bea.gov/api/data/?UserID={user_key}&method=GetData&datasetname={dataset}&KeyCode={keycode}&GeoFips={geo}&ResultFormat={fmt}'.format(user_key=BEA_key, dataset=dataset, keycode=keycode, fmt=fmt, geo=geo))
-    elif dataset=='NIPA':
-        p = requests.get('http://www.bea.gov/api/data/?&UserID={user_key}&method=GetData&DataSetName={dataset}&Year={year_list}&tableID={table_id}&Frequency={freq}&&ResultFormat={fmt}'.format(user_key=BEA_key, dataset=dataset, year_list='{}'.format(range(first_year, last_year+1)).replace(' ', '').replace('[', '').replace(']', ''), table_id=table_id, freq=freq, fmt=fmt))
-    try:
+    with datarequests.stage('bea', 'getBEAData', 'fetch'):
+        if dataset=='RegionalData':
+            p = datarequests.get('bea', 'http://bea.gov/api/data/?UserID={user_key}&method=GetData&datasetname={dataset}&KeyCode={keycode}&GeoFips={geo}&ResultFormat={fmt}'.format(user_key=BEA_key, dataset=dataset, keycode=keycode, fmt=fmt, geo=geo), mode=cache, cache_if=_beaSucceeded)
+        elif dataset=='NIPA':
+            p = datarequests.get('bea', 'http://www.bea.gov/api/data/?&UserID={user_key}&method=GetData&DataSetName={dataset}&Year={year_list}&tableID={table_id}&Frequency={freq}&&ResultFormat={fmt}'.format(user_key=BEA_key, dataset=dataset, year_list=','.join(str(y) for y in range(first_year, last_year+1)), table_id=table_id, freq=freq, fmt=fmt), mode=cache, cache_if=_beaSucceeded)
+    
+    with datarequests.stage('bea', 'getBEAData', 'parse'):
         p_text = p.json()
-    except:
-        p_text=p[0].json()
-        
-    df = pd.DataFrame(p_text['BEAAPI']['Results']['Data'])
-    df.TimePeriod = pd.to_datetime(df.TimePeriod)
+        df = _typeBEAFrame(pd.DataFrame(p_text['BEAAPI']['Results']['Data']))
     
-    # Clean GeoName to create Region field
-    # Named for principal city in MSA area.
-    # For example, "Baltimore-Columbia-Towson, MD" is listed as "Baltimore."
-    try:
-        df['Region'] = df.GeoName.str.split('-').str.get(0).str.split(',').str.get(0)
-    except:
-        pass
+    df['keycode'] = keycode
     
-    # Clean GeoName to create State field
+    if store is not None:
+        store.write(_warehouseBEA(df, pd.Series(keycode or table_id, index=df.index), pd.Series(freq, index=df.index)), 'bea')
+
+    return df
+
+def _getBEARequest(request, cache='ttl'):
+    '''
+    Sends one planned request from getBEABatch and returns its data, tagged with what was requested.
+    '''
+    params = dict(request, UserID=BEA_key, method='GetData', ResultFormat='json')
+    p = datarequests.get('bea', 'http://www.bea.gov/api/data/', params=sorted(params.items()), mode=cache, cache_if=_beaSucceeded)
     try:
-        df['State'] = df.GeoName.str.split(',').str.get(1).str.split(' ').str.get(1)
-    except:
-        pass
-    
-    # Change data type to float and int where necessary
-    df.DataValue = df.DataValue.astype(float)
-    df.GeoFips = df.GeoFips.astype(int)
-    df['keycode'] = keycode
+        data = p.json()['BEAAPI']['Results']['Data']
+    except (ValueError, KeyError):
+        print 'BEA request failed: {}'.format(request)
+        return None
+    df = pd.DataFrame(data)
+    df['dataset'] = request['DataSetName']
+    df['series'] = request.get('tableID', request.get('KeyCode'))
+    df['freq'] = request.get('Frequency', 'A')
+    return df
 
+def getBEABatch(tables=None, freqs=None, first_year=1990, last_year=2014, keycodes=None, geo='MSA', years_per_call=10, workers=None, cache='ttl', store=None):
+    '''
+    Fetches many NIPA tables and regional KeyCodes at once and returns them as one long-format dataframe
+    with dataset, series (table ID or KeyCode), freq, TimePeriod (parsed for annual, quarterly and monthly data)
+    and DataValue columns.
+    params:
+        - tables: list of NIPA table IDs
+        - freqs: list of NIPA frequencies, from {'A':'Annual', 'Q':'Quarterly', 'M':'Monthly'}. Defaults to ['A'].
+        - first_year: National data only. First year of data to retrieve
+        - last_year: National data only. Last year of data to retrieve
+        - keycodes: list of RegionalData KeyCodes, or short names from getBEAData
+        - geo: GeoFips for regional data
+        - years_per_call: NIPA year ranges are split into calls of at most this many years
+        - workers: number of requests in flight at once. Defaults to bea_workers.
+        - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+        - store: optional warehouse.Warehouse to also write the data into
+    '''
+    calls = []
+    for table_id in tables or []:
+        for freq in freqs or ['A']:
+            for start in range(first_year, last_year+1, years_per_call):
+                years = range(start, min(start+years_per_call, last_year+1))
+                calls.append({'DataSetName':'NIPA', 'tableID':table_id, 'Frequency':freq, 'Year':','.join(str(y) for y in years)})
+    for keycode in keycodes or []:
+        calls.append({'DataSetName':'RegionalData', 'KeyCode':keycode_dict.get(keycode, keycode), 'GeoFips':geo})
+    
+    with datarequests.stage('bea', 'getBEABatch', 'fetch'):
+        pool = ThreadPool(workers or bea_workers)
+        try:
+            frames = pool.map(lambda r: _getBEARequest(r, cache), calls)
+        finally:
+            pool.close()
+    
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        raise ValueError('No BEA data returned for tables {} and keycodes {}'.format(tables or [], keycodes or []))
+    
+    with datarequests.stage('bea', 'getBEABatch', 'assemble'):
+        df = pd.concat(frames, ignore_index=True)
+        for c in ['dataset', 'series', 'freq']:
+            df[c] = df[c].astype('category')
+    with datarequests.stage('bea', 'getBEABatch', 'parse'):
+        df = _typeBEAFrame(df)
+    
+    if store is not None:
+        store.write(_warehouseBEA(df, df.series, df.freq), 'bea')
+    
     return df
         
 def plotBEAData(df, region, title):
-    fig, ax = plt.subplots()
-    
-    for r in region:
-        d = df[df.Region==r].sort('TimePeriod')
-        plt.plot(d.TimePeriod, d.DataValue, label=r)
+    '''
+    Plots a line per region, with the y-axis in dollars. Returns the figure.
+    '''
+    # Plotting modules are only imported when a chart is drawn, so headless pulls start fast
+    import matplotlib.pyplot as plt
+    import charts
     
-    # Make a list of y-axis labels
-    labels = ax.get_yticks().tolist()
-    # Format them with a comma and a dollar sign at the front, and drop any decimal places
-    labels = ['$'+format(l, ',').split('.')[0] for l in labels]
-    # Set the y-axis to be labeled with the now-formatted labels
-    ax.set_yticklabels(labels)
+    fig, ax = plt.subplots()
     
-    plt.ylabel('{}'.format(df.keycode[0]))
-    plt.title('{}'.format(title))  
-    plt.legend(loc=0)
+    # The frame is split by region once, rather than filtered once per region
+    spec = {'style':'bea', 'groups':region, 'title':'{}'.format(title), 'ylabel':'{}'.format(df.keycode.iloc[0])}
+    charts.drawBEA(ax, spec, charts.selectSeries(charts.splitFrame(df, 'Region', 'TimePeriod', 'DataValue'), spec))
     
     plt.tight_layout()
     
     return fig
+
+def plotBEACharts(df, specs, workers=None):
+    '''
+    Renders and saves a batch of charts from one getBEAData frame in parallel worker processes.
+    See charts.py for the chart spec; use style 'bea' and regions as groups. Returns the paths written.
+    '''
+    import charts
+    return charts.renderCharts(df, specs, by='Region', x='TimePeriod', y='DataValue', workers=workers)
     
-def get5Yeargrowth(keycode):
+def get5Yeargrowth(keycode, since='2012-12-31'):
+    '''
+    Returns all regions and the top 25 regions with a keycode's value, five-year growth, and ranks within each year.
+    params:
+        - keycode: RegionalData KeyCode, or a short name from getBEAData
+        - since: only periods after this date are returned
+    '''
     df = getBEAData('RegionalData', keycode)
 
-    top25 = ['Atlanta', 'Baltimore', 'Boston', 'Charlotte', 'Chicago', 'Dallas', 'Denver', 'Detroit',
-             'Houston', 'Los Angeles', 'Miami', 'Minneapolis', 'New York', 'Philadelphia', 'Phoenix',
-             'Pittsburgh', 'Portland', 'Riverside', 'San Antonio', 'San Diego', 'San Francisco', 'St. Louis',
-             'Seattle', 'Tampa', 'Washington']
-         
-    if len(top25)==25:
-        ix = np.in1d(df.Region.ravel(), top25).reshape(df.Region.shape)
-        df['Top25'] = np.where(ix, 1, 0)
-    
-    df = df.groupby(['Region', 'TimePeriod'])[['Region', 'DataValue']].sum().reset_index()
-    r_pctchange = []
-    for r in df.Region.unique():
-        r_pctchange.append(df[df.Region==r].DataValue.pct_change(4))
-        df = df.join(pd.concat(r_pctchange), rsuffix='_pctchange')
-        
-    for v in ['DataValue', 'DataValue_pctchange']:
-        df = df[df.TimePeriod>'2012-12-31'].join(df[df.TimePeriod>'2012-12-31'][v].rank(ascending=False), rsuffix='_rank')
+    with datarequests.stage('bea', 'get5Yeargrowth', 'assemble'):
+        # Group on GeoFips so metros sharing a principal city name (e.g. Portland, OR and ME) stay apart
+        df = df.groupby(['GeoFips', 'Region', 'TimePeriod'], observed=True)['DataValue'].sum().reset_index()
+        # Five years of data span four annual changes
+        df = getGrowth(df, 'DataValue', 'GeoFips', 'TimePeriod', horizons=[4])
+        df = df[df.TimePeriod>since]
+    
+    df.rename(columns={'DataValue':keycode, 'DataValue_rank':keycode+'_rank', 'DataValue_4yeargrowth':keycode+'_5yeargrowth', 'DataValue_4yeargrowth_rank':keycode+'_5yeargrowth_rank'}, inplace=True)
     
-    df.rename(columns={'DataValue':keycode, 'DataValue_rank':keycode+'_rank', 'DataValue_pctchange':keycode+'_5yeargrowth', 'DataValue_pctchange_rank':keycode+'_5yeargrowth_rank'}, inplace=True)
+    df['Top25'] = np.where(df.GeoFips.isin(crosswalk.peerGroup('top25')), 1, 0)
     
     df25 = df[df.Top25==1]
     
-    return df, df25
\ No newline at end of file
+    return df, df25
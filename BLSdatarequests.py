@@ -21,162 +21,438 @@ The BLS limits API users to request 25 series per query when using the unregiste
 +-------------------------+--------------+--------------+
 """
 
-import requests
 import json
+import os
+import sqlite3
+import threading
+import warnings
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 import datetime as dt
-import seaborn as sb
 import calendar
+import datarequests
+from geography import crosswalk, us_key
+from multiprocessing.dummy import Pool as ThreadPool
 
 BLS_key=''
+# API limits from the table above, by whether BLS_key is set
+bls_limits = {True:{'series':50, 'years':20, 'daily':500}, False:{'series':25, 'years':10, 'daily':25}}
+# Number of queries sent to the BLS at once. The datarequests rate limit still applies.
+bls_workers = 4
+# Where plotBLSData saves charts
+chart_dir = r'G:\Publications\Annual Regional Report\2015'
 
-def getBLSData(geography, statistic, first_year, last_year, series_dict = {}, ann_avg='false'):
+class BLSQuota(object):
+    '''
+    Counts the queries sent to the BLS API today, so that large pulls can be checked against the daily limit.
+    The count is kept in a small JSON file and resets each day. Responses served from the cache do not count.
+    '''
+    def __init__(self, path=None):
+        self.path = path or os.path.join(datarequests.data_dir, 'bls_quota.json')
+        self._lock = threading.Lock()
+        
+    def _read(self):
+        today = dt.date.today().isoformat()
+        try:
+            with open(self.path) as f:
+                usage = json.load(f)
+        except (IOError, OSError, ValueError):
+            usage = {}
+        return usage if usage.get('date') == today else {'date':today, 'queries':0}
+        
+    def used(self):
+        with self._lock:
+            return self._read()['queries']
+        
+    def remaining(self):
+        return bls_limits[bool(BLS_key)]['daily'] - self.used()
+        
+    def add(self, n=1):
+        with self._lock:
+            usage = self._read()
+            usage['queries'] += n
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with open(self.path, 'w') as f:
+                json.dump(usage, f)
+
+bls_quota = BLSQuota()
+
+def planBLSQueries(series, first_year, last_year):
+    '''
+        Splits a request into queries that fit the BLS limits on series and years per query.
+        Returns a list of (series list, first year, last year) tuples.
+        parameters:
+            - series: list of BLS series codes
+            - first_year: First year for which data is to be requested.
+            - last_year: Last year for which data is to be requested.
+    '''
+    limits = bls_limits[bool(BLS_key)]
+    series = list(series)
+    queries = []
+    for start in range(int(first_year), int(last_year)+1, limits['years']):
+        end = min(start+limits['years']-1, int(last_year))
+        for i in range(0, len(series), limits['series']):
+            queries.append((series[i:i+limits['series']], start, end))
+    return queries
+
+def _blsSucceeded(response):
+    '''
+        BLS reports errors, including exhausted daily quotas, in the body of a successful response. Only keep responses with data.
+    '''
+    try:
+        return response.json().get('status') == 'REQUEST_SUCCEEDED'
+    except (ValueError, AttributeError):
+        return False
+
+def _postBLSQuery(query, ann_avg='false', cache='ttl'):
+    '''
+        Sends one planned query to the BLS and returns the decoded JSON response.
+    '''
+    series, first_year, last_year = query
+    headers = {'Content-type': 'application/json'}
+    data = json.dumps({"seriesid": series, "startyear":str(first_year), "endyear":str(last_year), 'registrationKey':BLS_key, 'annualaverage':'{}'.format(ann_avg)})
+    # If you have a registration key from the BLS, pass it through above as 'registrationKey':''
+    # Request a registration key to use the BLS API v2.0 here: http://data.bls.gov/registrationEngine/
+    p = datarequests.post('bls', 'http://api.bls.gov/publicAPI/v2/timeseries/data/', data=data, headers=headers, mode=cache,
+                          cache_if=_blsSucceeded)
+    if not p.from_cache:
+        bls_quota.add()
+    try:
+        return json.loads(p.text)
+    except ValueError:
+        # An error page instead of JSON is reported like any other failed query
+        return {'status':'REQUEST_NOT_PROCESSED', 'message':['Response was not JSON']}
+
+def fetchBLSSeries(series, first_year, last_year, ann_avg='false', cache='ttl'):
+    '''
+        Requests any number of series over any range of years. The request is split into queries within
+        the BLS limits, which are sent concurrently (bls_workers at a time). Returns the list of series
+        results from all queries.
+        parameters:
+            - series: list of BLS series codes
+            - first_year: First year for which data is to be requested.
+            - last_year: Last year for which data is to be requested.
+            - ann_avg: String argument for whether to include annual averages.
+            - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+    '''
+    queries = planBLSQueries(series, first_year, last_year)
+    if cache != 'offline' and len(queries) > bls_quota.remaining():
+        print 'This request needs {} BLS queries, but only {} remain in today\'s limit.'.format(len(queries), bls_quota.remaining())
+    
+    pool = ThreadPool(max(1, min(bls_workers, len(queries))))
+    try:
+        responses = pool.map(lambda q: _postBLSQuery(q, ann_avg, cache), queries)
+    finally:
+        pool.close()
+    
+    results = []
+    for query, json_data in zip(queries, responses):
+        if json_data.get('status') != 'REQUEST_SUCCEEDED':
+            print 'BLS query for {}-{} failed: {}'.format(query[1], query[2], '; '.join(json_data.get('message', [])))
+        results.extend(json_data.get('Results', {}).get('series', []))
+    return results
+
+# Series ID pieces for built-in statistics. LAUS IDs are LAU + area + measure, CES IDs are
+# SMU + state + area + industry + data type, and CPI IDs are CUUR + area + item.
+laus_measures = {'Unemployment Rate':'03', 'Unemployment':'04', 'Employment Level':'05', 'Labor Force':'06'}
+ces_industries = {'Employment':'00000000', 'Private Employment':'05000000'}
+# Built-in geographies. 'Large Metros' is every metro row in geography.csv: the 54 largest metros, not every CBSA.
+bls_geographies = ['Top 25 Metros', 'All States', 'Large Metros']
+# Earlier names of built-in geographies
+renamed_geographies = {'All Metros':'Large Metros'}
+# Periods holding annual averages: M13 for monthly series, S03 for semiannual and A01 for annual
+annual_periods = ['M13', 'S03', 'A01']
+# National series for each statistic, with the location name they are reported under
+us_series = {'Unemployment Rate':('LNU04000000', 'US'), 'Unemployment':('LNU03000000', 'US'),
+             'Employment Level':('LNU02000000', 'US'), 'Labor Force':('LNU01000000', 'US'),
+             'Employment':('CEU0000000001', 'US'), 'Private Employment':('CEU0500000001', 'US'),
+             'CPI':('CUUR0000SA0', 'US City Average')}
+_names = {}
+
+def buildSeries(statistic, geography, us=True):
+    '''
+        Generates BLS series IDs for a statistic across a set of geographies from the geography crosswalk.
+        Returns a dictionary with the structure {BLS series code: Geography name}, as used by getBLSData.
+        parameters:
+            - statistic: 'Unemployment Rate', 'Unemployment', 'Employment Level', 'Labor Force' (LAUS),
+                'Employment', 'Private Employment' (CES) or 'CPI'
+            - geography: one of bls_geographies: 'Top 25 Metros', 'All States' or 'Large Metros'.
+                'All Metros' is accepted as a deprecated name for 'Large Metros'.
+            - us: whether to include the national series
+    '''
+    if geography in renamed_geographies:
+        warnings.warn("'{}' is deprecated; use '{}', which covers the metros in geography.csv rather than every CBSA".format(
+                      geography, renamed_geographies[geography]), DeprecationWarning, stacklevel=2)
+        geography = renamed_geographies[geography]
+    geo = crosswalk.table
+    if statistic == 'CPI':
+        # CPI is published for its own set of areas, not for states or individual metros
+        rows = geo[geo.geo_type=='cpi'] if geography != 'All States' else geo[:0]
+    else:
+        rows = geo[geo.geo_type==('state' if geography == 'All States' else 'msa')]
+    if geography == 'Top 25 Metros':
+        rows = rows[rows.top25=='1']
+    
+    if statistic in laus_measures:
+        prefix = np.where(rows.geo_type=='state', 'LAUST', 'LAUMT')
+        area = np.where(rows.geo_type=='state', rows.state_fips+'00000', rows.state_fips+rows.bls_area)
+        ids = prefix + area + '000000' + laus_measures[statistic]
+    elif statistic in ces_industries:
+        area = np.where(rows.geo_type=='state', '00000', rows.bls_area)
+        ids = 'SMU' + rows.state_fips + area + ces_industries[statistic] + '01'
+    elif statistic == 'CPI':
+        ids = 'CUUR' + rows.cpi_area + 'SA0'
+    else:
+        print 'No built-in series for {}.'.format(statistic)
+        return {}
+    
+    series_dict = dict(zip(ids, rows.name))
+    if us:
+        series_dict[us_series[statistic][0]] = us_series[statistic][1]
+    return series_dict
+
+def seriesNames():
+    '''
+        Returns the index {BLS series code: Geography name} of every built-in series, built on first use.
+    '''
+    if 'names' not in _names:
+        names = {}
+        for statistic in us_series:
+            for geography in ['All States', 'Large Metros']:
+                names.update(buildSeries(statistic, geography))
+        _names['names'] = names
+    return _names['names']
+
+def parseBLSResults(results, series_dict=None):
+    '''
+        Flattens BLS series results into a single dataframe. Observations are copied into preallocated
+        columns in one pass, then years, values and dates are converted once over the whole frame.
+        Returns columns seriesID, location, year, period, periodName, value, annual and date.
+        parameters:
+            - results: list of series results, as in json_data['Results']['series']
+            - series_dict: {BLS series code: Geography name}, used to fill location
+    '''
+    n = sum(len(r['data']) for r in results)
+    columns = ['seriesID', 'year', 'period', 'periodName', 'value']
+    arrays = dict((c, np.empty(n, dtype=object)) for c in columns)
+    
+    i = 0
+    for r in results:
+        j = i + len(r['data'])
+        arrays['seriesID'][i:j] = r['seriesID']
+        for c in columns[1:]:
+            arrays[c][i:j] = [obs[c] for obs in r['data']]
+        i = j
+    
+    return _typeBLSFrame(pd.DataFrame(arrays, columns=columns), series_dict)
+
+def _typeBLSFrame(df, series_dict=None):
+    '''
+        Converts a frame of raw BLS observations (seriesID, year, period, periodName, value) to the
+        typed layout returned by getBLSData.
+    '''
+    # Series not named in series_dict fall back to the built-in series names
+    df['location'] = df.seriesID.map(series_dict or {}).fillna(df.seriesID.map(seriesNames()))
+    df['year'] = df.year.astype(int)
+    # Unavailable observations are reported as '-'
+    df['value'] = pd.to_numeric(df.value, errors='coerce')
+    
+    # Periods are Mnn (monthly, M13 = annual average), Qnn, Snn (S03 = annual) or A01
+    kind = df.period.str[0]
+    num = df.period.str[1:3].astype(int)
+    df['annual'] = df.period.isin(annual_periods)
+    month = np.select([(kind=='M') & (num<=12), kind=='Q', (kind=='S') & (num<=2)], [num, (num-1)*3+1, (num-1)*6+1], 1)
+    df['date'] = pd.to_datetime(df.year*10000 + month*100 + 1, format='%Y%m%d')
+    
+    for c in ['seriesID', 'period', 'periodName']:
+        df[c] = df[c].astype('category')
+    
+    return df[['seriesID', 'location', 'year', 'period', 'periodName', 'value', 'annual', 'date']]
+
+class BLSHistory(object):
+    '''
+    Local store of BLS observations keyed by series ID, year and period. The years each series has been
+    fetched for are kept per ann_avg setting, so sync() only asks the API for years before and after that
+    range, plus a revision window at the end, since BLS republishes recent months and re-benchmarks the
+    prior year. read() serves data from the store without the network.
+        parameters:
+            - path: SQLite file holding the store
+            - revision_years: years before the last fetched year that are requested again on each sync
+    '''
+    def __init__(self, path=None, revision_years=1):
+        self.path = path or os.path.join(datarequests.data_dir, 'bls_history.sqlite')
+        self.revision_years = revision_years
+        self._conn = None
+        
+    def _connect(self):
+        if self._conn is None:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS observations (seriesID TEXT, year INTEGER, period TEXT,
+                                  periodName TEXT, value REAL, PRIMARY KEY (seriesID, year, period))''')
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS coverage (seriesID TEXT, ann_avg TEXT, first_year INTEGER,
+                                  last_year INTEGER, PRIMARY KEY (seriesID, ann_avg))''')
+            self._conn.commit()
+        return self._conn
+        
+    def coverage(self, series, ann_avg='false'):
+        '''
+        Returns {series code: (first year, last year)} fetched with this ann_avg setting, for the series
+        that have been synced. Years in the range with no observations were fetched and found empty.
+        '''
+        conn = self._connect()
+        covered = {}
+        for i in range(0, len(series), 500):
+            chunk = list(series[i:i+500])
+            rows = conn.execute('SELECT seriesID, first_year, last_year FROM coverage WHERE ann_avg = ? AND seriesID IN ({})'.format(','.join('?'*len(chunk))),
+                                [str(ann_avg).lower()]+chunk)
+            covered.update((sid, (first, last)) for sid, first, last in rows.fetchall())
+        return covered
+        
+    def write(self, results):
+        '''
+        Stores series results, as returned by fetchBLSSeries, replacing any revised observations.
+        '''
+        rows = []
+        for r in results:
+            for obs in r['data']:
+                # Unavailable observations are reported as '-'
+                try:
+                    value = float(obs['value'])
+                except ValueError:
+                    value = None
+                rows.append((r['seriesID'], int(obs['year']), obs['period'], obs['periodName'], value))
+        conn = self._connect()
+        conn.executemany('INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?)', rows)
+        conn.commit()
+        
+    def sync(self, series, first_year, last_year, ann_avg='false', cache='ttl'):
+        '''
+        Brings the stored series up to date for first_year through last_year. Each series needs the years
+        before its fetched range and the years from the revision window onwards; a range that does not
+        meet the fetched one is widened to meet it, so the fetched years stay contiguous. Series are
+        grouped by the years they need, so that each group is one planned request.
+        '''
+        series = list(series)
+        first_year, last_year, ann_avg = int(first_year), int(last_year), str(ann_avg).lower()
+        covered = self.coverage(series, ann_avg)
+        ranges, extents = {}, {}
+        for sid in series:
+            if sid not in covered:
+                ranges.setdefault((first_year, last_year), []).append(sid)
+                extents[sid] = (first_year, last_year)
+                continue
+            first, last = covered[sid]
+            if first_year < first:
+                ranges.setdefault((first_year, first-1), []).append(sid)
+            start = min(max(first_year, last-self.revision_years), last+1)
+            if start <= last_year:
+                ranges.setdefault((start, last_year), []).append(sid)
+            extents[sid] = (min(first, first_year), max(last, last_year))
+        
+        # Series missing from a response (a failed query) keep their old range, so they are asked for again
+        missing = set()
+        for (start, end) in sorted(ranges):
+            results = fetchBLSSeries(ranges[(start, end)], start, end, ann_avg, cache)
+            self.write(results)
+            missing.update(set(ranges[(start, end)])-set(r['seriesID'] for r in results))
+        conn = self._connect()
+        conn.executemany('INSERT OR REPLACE INTO coverage VALUES (?, ?, ?, ?)',
+                         [(sid, ann_avg, first, last) for sid, (first, last) in extents.items() if sid not in missing])
+        conn.commit()
+            
+    def read(self, series_dict, first_year, last_year, ann_avg='false'):
+        '''
+        Returns stored observations for the series in series_dict in the getBLSData layout. Annual averages
+        (annual_periods) are only returned with ann_avg='true', whichever setting they were synced with.
+        '''
+        series = list(series_dict.keys())
+        annual = '' if str(ann_avg).lower() == 'true' else ' AND period NOT IN ({})'.format(','.join('?'*len(annual_periods)))
+        conn = self._connect()
+        frames = []
+        for i in range(0, len(series), 500):
+            chunk = series[i:i+500]
+            frames.append(pd.read_sql_query('SELECT seriesID, year, period, periodName, value FROM observations '
+                                            'WHERE seriesID IN ({}) AND year BETWEEN ? AND ?{} ORDER BY seriesID, year DESC, period DESC'.format(','.join('?'*len(chunk)), annual),
+                                            conn, params=chunk+[int(first_year), int(last_year)]+(annual_periods if annual else [])))
+        return _typeBLSFrame(pd.concat(frames, ignore_index=True), series_dict)
+
+bls_history = BLSHistory()
+
+def _blsGeoKey(sid):
+    '''
+        Returns the warehouse geography key encoded in a series ID (see buildSeries), or None if the
+        series is not one of the built-in kinds. CPI areas have no FIPS equivalent and keep their area code.
+    '''
+    if sid.startswith(('LAUST', 'LAUMT')):
+        state, area = sid[5:7], sid[7:12]
+    elif sid.startswith(('SMU', 'SMS')):
+        state, area = sid[3:5], sid[5:10]
+    elif sid.startswith(('CUUR', 'CUSR')):
+        return us_key if sid[4:8] == '0000' else sid[4:8]
+    elif sid.startswith(('LNU', 'LNS', 'CEU', 'CES')):
+        return us_key
+    else:
+        return None
+    return state if area == '00000' else crosswalk.geoKeys([area], 'bls_area', 'msa')[0]
+
+def _warehouseBLS(df):
+    '''
+        Reshapes getBLSData output to the warehouse layout. Annual averages are stored as series <seriesID>/annual,
+        since they are dated the same as January. Series whose ID does not encode a known area are keyed by location.
+    '''
+    series = df.seriesID.astype(str)
+    keys = dict((sid, _blsGeoKey(sid)) for sid in series.unique())
+    geo = series.map(keys).fillna(df.location.astype(object)).fillna('')
+    return pd.DataFrame({'series':series.where(~df.annual, series+'/annual'), 'geo':geo,
+                         'period':df.date, 'value':df.value})
+
+def getBLSData(geography, statistic, first_year, last_year, series_dict=None, ann_avg='false', cache='ttl', sync=False, store=None):
     '''
         The primary means for requesting data from the BLS API.
         parameters:
-            - geography: Used for built-in series. 'Other' if a unique API call is needed.
-            - statistic: used for built-in series. 'Other' if a unique API call is needed.
+            - geography: Used for built-in series, see bls_geographies. 'Other' if a unique API call is needed.
+            - statistic: used for built-in series, see buildSeries. 'Other' if a unique API call is needed.
             - first_year: First year for which data is to be requested.
             - last_year: Last year for which data is to be requested.
             - series_dict: If unique call to the BLS is needed, pass a dictionary with this structure: {BLS series code: Geography name}
+                Any number of series and years may be requested; the request is split to fit the BLS limits.
             - ann_avg: String argument for whether to include annual averages.
-    ''''
-    if geography == 'Top 25 Metros':
-        if statistic == 'Unemployment Rate':
-            series = ['LAUMT043806000000003','LAUMT063108000000003','LAUMT064014000000003',
-                      'LAUMT064174000000003','LAUMT064186000000003','LAUMT081974000000003',
-                      'LAUMT114790000000003','LAUMT123310000000003','LAUMT124530000000003',
-                      'LAUMT131206000000003','LAUMT171698000000003','LAUMT241258000000003',
-                      'LAUMT257165000000003','LAUMT261982000000003','LAUMT273346000000003',
-                      'LAUMT294118000000003','LAUMT363562000000003','LAUMT371674000000003',
-                      'LAUMT413890000000003','LAUMT423798000000003','LAUMT423830000000003',
-                      'LAUMT481910000000003','LAUMT482642000000003','LAUMT484170000000003',
-                      'LAUMT534266000000003','LNU04000000']
-            series_dict = {'LAUMT043806000000003':'Phoenix','LAUMT063108000000003':'Los Angeles','LAUMT064014000000003':'Riverside',
-                           'LAUMT064174000000003':'San Diego','LAUMT064186000000003':'San Francisco','LAUMT081974000000003':'Denver',
-                           'LAUMT114790000000003':'Washington, DC','LAUMT123310000000003':'Miami','LAUMT124530000000003':'Tampa',
-                           'LAUMT131206000000003':'Atlanta','LAUMT171698000000003':'Chicago','LAUMT241258000000003':'Baltimore',
-                           'LAUMT257165000000003':'Boston','LAUMT261982000000003':'Detroit','LAUMT273346000000003':'Minneapolis',
-                           'LAUMT294118000000003':'St. Louis','LAUMT363562000000003':'New York','LAUMT371674000000003':'Charlotte',
-                           'LAUMT413890000000003':'Portland','LAUMT423798000000003':'Philadelphia','LAUMT423830000000003':'Pittsburgh',
-                           'LAUMT481910000000003':'Dallas','LAUMT482642000000003':'Houston','LAUMT484170000000003':'San Antonio',
-                           'LAUMT534266000000003':'Seattle','LNU04000000':'US'}
-        elif statistic == 'Employment':
-            series = ['SMU04380600000000001','SMU06310800000000001','SMU06401400000000001',
-                      'SMU06417400000000001','SMU06418600000000001','SMU08197400000000001',
-                      'SMU11479000000000001','SMU12331000000000001','SMU12453000000000001',
-                      'SMU13120600000000001','SMU17169800000000001','SMU24125800000000001',
-                      'SMU25716500000000001','SMU26198200000000001','SMU27334600000000001',
-                      'SMU29411800000000001','SMU36356200000000001','SMU37167400000000001',
-                      'SMU41389000000000001','SMU42379800000000001','SMU42383000000000001',
-                      'SMU48191000000000001','SMU48264200000000001','SMU48417000000000001',
-                      'SMU53426600000000001','CEU0000000001']
-            series_dict = {'SMU04380600000000001':'Phoenix','SMU06310800000000001':'Los Angeles','SMU06401400000000001':'Riverside',
-                           'SMU06417400000000001':'San Diego','SMU06418600000000001':'San Francisco','SMU08197400000000001':'Denver',
-                           'SMU11479000000000001':'Washington, DC','SMU12331000000000001':'Miami','SMU12453000000000001':'Tampa',
-                           'SMU13120600000000001':'Atlanta','SMU17169800000000001':'Chicago','SMU24125800000000001':'Baltimore',
-                           'SMU25716500000000001':'Boston','SMU26198200000000001':'Detroit','SMU27334600000000001':'Minneapolis',
-                           'SMU29411800000000001':'St. Louis','SMU36356200000000001':'New York','SMU37167400000000001':'Charlotte',
-                           'SMU41389000000000001':'Portland','SMU42379800000000001':'Philadelphia','SMU42383000000000001':'Pittsburgh',
-                           'SMU48191000000000001':'Dallas','SMU48264200000000001':'Houston','SMU48417000000000001':'San Antonio',
-                           'SMU53426600000000001':'Seattle', 'CEU0000000001':'US'}
-        elif statistic =='Private Employment':
-            series = ['SMU04380600500000001', 'SMU06310800500000001', 'SMU06401400500000001',
-                      'SMU06417400500000001', 'SMU06418600500000001', 'SMU08197400500000001',
-                      'SMU11479000500000001', 'SMU12331000500000001', 'SMU12453000500000001',
-                      'SMU13120600500000001', 'SMU17169800500000001', 'SMU24125800500000001',
-                      'SMU25716500500000001', 'SMU26198200500000001', 'SMU27334600500000001',
-                      'SMU29411800500000001', 'SMU36356200500000001', 'SMU37167400500000001',
-                      'SMU41389000500000001', 'SMU42379800500000001', 'SMU42383000500000001',
-                      'SMU48191000500000001', 'SMU48264200500000001', 'SMU48417000500000001',
-                      'SMU53426600500000001', 'CEU0500000001']
-            series_dict = {'SMU04380600500000001':'Phoenix', 'SMU06310800500000001':'Los Angeles', 'SMU06401400500000001':'Riverside',
-                      'SMU06417400500000001':'San Diego', 'SMU06418600500000001':'San Francisco', 'SMU08197400500000001':'Denver',
-                      'SMU11479000500000001':'Washington, DC', 'SMU12331000500000001':'Miami', 'SMU12453000500000001':'Tampa',
-                      'SMU13120600500000001':'Atlanta', 'SMU17169800500000001':'Chicago', 'SMU24125800500000001':'Baltimore',
-                      'SMU25716500500000001':'Boston', 'SMU26198200500000001':'Detroit', 'SMU27334600500000001':'Minneapolis',
-                      'SMU29411800500000001':'St. Louis', 'SMU36356200500000001':'New York', 'SMU37167400500000001':'Charlotte',
-                      'SMU41389000500000001':'Portland', 'SMU42379800500000001':'Philadelphia', 'SMU42383000500000001':'Pittsburgh',
-                      'SMU48191000500000001':'Dallas', 'SMU48264200500000001':'Houston', 'SMU48417000500000001':'San Antonio',
-                      'SMU53426600500000001':'Seattle', 'CEU0500000001':'US'}
-        elif statistic == 'CPI':
-            series = ['CUUR0000SA0', 'CUURA101SA0', 'CUURA102SA0',
-                      'CUURA103SA0', 'CUURA104SA0', 'CUURA207SA0',
-                      'CUURA208SA0', 'CUURA209SA0', 'CUURA211SA0',
-                      'CUURA311SA0', 'CUURA316SA0', 'CUURA318SA0',
-                      'CUURA319SA0', 'CUURA320SA0', 'CUURA421SA0',
-                      'CUURA422SA0', 'CUURA423SA0', 'CUURA424SA0',
-                      'CUURA425SA0', 'CUURA433SA0',]
-            series_dict = {'CUUR0000SA0':'US City Average', 'CUURA101SA0':'New York', 'CUURA102SA0':'Philadelphia',
-                           'CUURA103SA0':'Boston', 'CUURA104SA0':'Pittsburgh', 'CUURA207SA0':'Chicago',
-                           'CUURA208SA0':'Detroit', 'CUURA209SA0':'St. Louis', 'CUURA211SA0':'Minneapolis',
-                           'CUURA311SA0':'Baltimore-Washington', 'CUURA316SA0':'Dallas', 'CUURA318SA0':'Houston',
-                           'CUURA319SA0':'Atlanta', 'CUURA320SA0':'Miami', 'CUURA421SA0':'Los Angeles',
-                           'CUURA422SA0':'San Francisco', 'CUURA423SA0':'Seattle', 'CUURA424SA0':'San Diego',
-                           'CUURA425SA0':'Portland', 'CUURA433SA0':'Denver',}
-    elif geography == 'All States':
-        if statistic == 'Unemployment Rate':
-            series = ['LAUST010000000000003','LAUST020000000000003','LAUST040000000000003', 'LAUST050000000000003','LAUST060000000000003',
-                      'LAUST080000000000003','LAUST090000000000003', 'LAUST100000000000003', 'LAUST110000000000003', 'LAUST120000000000003',
-                      'LAUST130000000000003', 'LAUST150000000000003', 'LAUST160000000000003', 'LAUST170000000000003', 'LAUST180000000000003',
-                      'LAUST190000000000003', 'LAUST200000000000003', 'LAUST210000000000003', 'LAUST220000000000003', 'LAUST230000000000003',
-                      'LAUST240000000000003', 'LAUST250000000000003', 'LAUST260000000000003', 'LAUST270000000000003', 'LAUST280000000000003',
-                      'LAUST290000000000003', 'LAUST300000000000003','LAUST310000000000003','LAUST320000000000003','LAUST330000000000003',
-                      'LAUST340000000000003', 'LAUST350000000000003', 'LAUST360000000000003', 'LAUST370000000000003', 'LAUST380000000000003',
-                      'LAUST390000000000003','LAUST400000000000003','LAUST410000000000003','LAUST420000000000003','LAUST440000000000003',
-                      'LAUST450000000000003','LAUST460000000000003','LAUST470000000000003','LAUST480000000000003','LAUST490000000000003',
-                      'LAUST500000000000003','LAUST510000000000003','LAUST530000000000003','LAUST540000000000003','LAUST550000000000003',
-                      'LAUST560000000000003','LAUST720000000000003']
-            series_dict = {'':'', '':''}
-        elif statistic == 'Employment':
-            series = []
-            series_dict = {'':'', '':''}
-    elif geography == 'All Metros':
-        if statistic == 'Unemployment Rate':
-            series = []
-            series_dict = {'':'', '':''}
-        elif statistic == 'Employment':
-            series = []
-            series_dict = {'':'', '':''}
+            - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+            - sync: If True, only request periods missing from the local history store (bls_history), then read from it.
+            - store: optional warehouse.Warehouse to also write the data into
+    '''
+    if geography in bls_geographies or geography in renamed_geographies:
+        series_dict = buildSeries(statistic, geography)
+    series_dict = series_dict or {}
+    
+    if sync:
+        with datarequests.stage('bls', 'getBLSData', 'fetch'):
+            bls_history.sync(series_dict.keys(), first_year, last_year, ann_avg, cache)
+        with datarequests.stage('bls', 'getBLSData', 'parse'):
+            df = bls_history.read(series_dict, first_year, last_year, ann_avg)
     else:
-        series_dict = series_dict
+        # Queries are split to fit the BLS limits on series and years, then stitched back together
+        with datarequests.stage('bls', 'getBLSData', 'fetch'):
+            results = fetchBLSSeries(list(series_dict.keys()), first_year, last_year, ann_avg, cache)
+        with datarequests.stage('bls', 'getBLSData', 'parse'):
+            df = parseBLSResults(results, series_dict)
     
-    headers = {'Content-type': 'application/json'}
-    data = json.dumps({"seriesid": series_dict.keys(), "startyear":str(first_year), "endyear":str(last_year), 'registrationKey':BLS_key, 'annualaverage':'{}'.format(ann_avg)})
-    # If you have a registration key from the BLS, pass it through above as 'registrationKey':''
-    # Request a registration key to use the BLS API v2.0 here: http://data.bls.gov/registrationEngine/
-    p = requests.post('http://api.bls.gov/publicAPI/v2/timeseries/data/', data=data, headers=headers)
-    json_data = json.loads(p.text)
-       
-    dataframes = []
-    for i in range(0, len(json_data['Results']['series'])):
-        df = pd.DataFrame(json_data['Results']['series'][i]['data'])
-        if len(df) > 0:
-            try:
-                df['location'] = series_dict[json_data['Results']['series'][i]['seriesID']]
-            except:
-                df['code'] = json_data['Results']['series'][i]['seriesID']
-            # Create datetime field
-            df['day'] = 01
-            df['date'] = pd.to_datetime(df['year'].astype(int)*10000 + np.where(df.period!='M13', df.period.str[1:3].astype(int)*100, 100) + df.day, format='%Y%m%d')
-            # Convert values to float
-            df.value = df.value.astype(float)
-            dataframes.append(df)
-
-    # Add code to combine dataframes by appending all dataframes onto first dataframe
-    df = pd.concat(dataframes)
+    if store is not None:
+        store.write(_warehouseBLS(df), 'bls')
     
     return df
     
-def updateUnemploymentRate(month, year1, year2):
+def updateUnemploymentRate(month, year1, year2, sync=True):
     '''
         Returns a dataframe with the unemployment rate for a given month in two years. Typically used for year t and t-1, to update the EAGB Data Center
         parameters:
             - month: Takes an integer value for month (1-2) or full name for a month as a string ('January')
             - year1: Takes an integer value for the year on which to sort the resulting dataframe. Typically the current or most recent year for which data is available.
             - year2: Takes an integer value for the year of comparison. Typically the year prior to the current or most recent year. 
+            - sync: If True, only new periods are requested and data is read from the local history store.
     '''
     if month < 1 or month > 12:
         print 'This function only accepts month values 1-2 or full month names.'
@@ -184,7 +460,7 @@ def updateUnemploymentRate(month, year1, year2):
     month_dict = {v:k for k,v in enumerate(calendar.month_name)}
     month = month_dict[month] if type(month)==str else month
     
-    df = getBLSData('Top 25 Metros', 'Unemployment Rate', year1, year2)
+    df = getBLSData('Top 25 Metros', 'Unemployment Rate', min(year1, year2), max(year1, year2), sync=sync)
     
     df = pd.merge(df[df.date=='{year1}-{month}-01'.format(year1=year1, month=month)][['location', 'value']],
                   df[df.date=='{year2}-{month}-01'.format(year2=year2, month=month)][['location', 'value']],
@@ -199,14 +475,14 @@ def updateUnemploymentRate(month, year1, year2):
     
     return df
 
-def updateEmploymentGrowth(year1, year2):
-    df = getBLSData('Top 25 Metros', 'Employment', year1, year2, ann_avg='true')
+def updateEmploymentGrowth(year1, year2, sync=True):
+    df = getBLSData('Top 25 Metros', 'Employment', year1, year2, ann_avg='true', sync=sync)
     # Use only Annual Averages
     df = df[df.periodName=='Annual']
 
     # Match data years    
-    ten_year = df[df.year==str(year1)].merge(df[df.year==str(year2)], on='location', suffixes=['_'+str(year1)[2:4], '_'+str(year2)[2:4]])
-    one_year = df[df.year==str(year2-1)].merge(df[df.year==str(year2)], on='location', suffixes=['_'+str(year2-1)[2:4], '_'+str(year2)[2:4]])
+    ten_year = df[df.year==year1].merge(df[df.year==year2], on='location', suffixes=['_'+str(year1)[2:4], '_'+str(year2)[2:4]])
+    one_year = df[df.year==year2-1].merge(df[df.year==year2], on='location', suffixes=['_'+str(year2-1)[2:4], '_'+str(year2)[2:4]])
     # Calculate percent change and rank it
     ten_year['percent_change'] = (ten_year['value_'+str(year2)[2:4]]-ten_year['value_'+str(year1)[2:4]])/ten_year['value_'+str(year1)[2:4]]
     ten_year['rank'] = ten_year.percent_change.rank(ascending=False)
@@ -218,30 +494,35 @@ def updateEmploymentGrowth(year1, year2):
 # Example: df = getBLSData('Top 25 Metros', 'Unemployment Rate', 2015, 2015)
 
 # Add code to plot data from BLS request
-def plotBLSData(geography, statistic, first_year, last_year, series = [], save=False):
-    data = getBLSData(geography, statistic, first_year, last_year, series)
+def plotBLSData(geography, statistic, first_year, last_year, series = [], save=False, df=None):
+    '''
+        Plots a statistic with a line per location, and US City Average in grey. Returns the figure.
+        parameters:
+            - geography, statistic, first_year, last_year, series: as for getBLSData
+            - save: If True, the chart is saved as PNG and EPS in chart_dir
+            - df: frame already returned by getBLSData. If not given, the data is requested.
+    '''
+    # Plotting modules are only imported when a chart is drawn, so headless pulls start fast
+    import matplotlib.pyplot as plt
+    import charts
+    
+    data = df if df is not None else getBLSData(geography, statistic, first_year, last_year, series)
+    spec = {'style':'bls', 'statistic':statistic, 'title':statistic+' Among '+geography+'\n'+str(first_year)+' - '+str(last_year-1),
+            'path':os.path.join(chart_dir, '{stat}_{geo}'.format(stat=statistic, geo=geography))}
     
     fig, ax = plt.subplots()
-    for loc in data[data.location!='US City Average'].location.unique():
-        ax.plot(data[data.location==loc].date, data[data.location==loc].value, label=loc)
-    ax.plot(data[data.location=='US City Average'].date, data[data.location=='US City Average'].value,
-            c='#363737', alpha= 0.3, label='US City Average')
-    # Manage titles
-    plt.title(statistic+' Among '+geography+'\n'+str(first_year)+' - '+str(last_year-1))
-    ax.set_ylabel(statistic)
-    # Manage labels
-    labels = ax.get_yticks().tolist()
-    label_treatments = {'Unemployment Rate':[format(l).split('.')[0]+'%' for l in labels],
-                        'Employment':[format(int(l)*1000, ',').split('.')[0] for l in labels],
-                        'CPI':[format(l, ',').split('.')[0] for l in labels],
-                        }
-    labels = label_treatments[statistic]
-    ax.set_yticklabels(labels)
-    # Manage legend
-    leg1 = ax.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
+    # The frame is split by location once, rather than filtered once per location
+    charts.drawBLS(ax, spec, charts.selectSeries(charts.splitFrame(data, 'location', 'date', 'value'), spec))
     
     if save==True:
-        plt.savefig(r'G:\Publications\Annual Regional Report\2015\{stat}_{geo}.png'.format(stat=statistic, geo=geography), bbox_inches='tight', dpi=600, alpha=True)
-        plt.savefig(r'G:\Publications\Annual Regional Report\2015\{stat}_{geo}.eps'.format(stat=statistic, geo=geography), bbox_inches='tight', dpi=600, alpha=True)
+        charts.saveChart(fig, spec['path'])
         
-    return
\ No newline at end of file
+    return fig
+
+def plotBLSCharts(df, specs, workers=None):
+    '''
+        Renders and saves a batch of charts from one getBLSData frame in parallel worker processes.
+        See charts.py for the chart spec. Returns the paths written.
+    '''
+    import charts
+    return charts.renderCharts(df, specs, by='location', x='date', y='value', workers=workers)
@@ -3,82 +3,286 @@
 Created on Fri Aug 21 08:39:57 2015
 
 @author: pdougherty
+
+Scrapes the Inc. 5000 list one company at a time. Each company's page gives the ID of the next
+company on the list (next_id), and company #5000 has no next_id.
 """
 
-import requests
+import os
+import json
 import pandas as pd
+import datarequests
+from geography import crosswalk
+from collections import deque
+from multiprocessing.dummy import Pool as ThreadPool
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+try:
+    text_type = unicode
+except NameError:
+    text_type = str
+
+# ID of the #1 company on each year's Inc. 5000 list, where a crawl starts.
+# If scraping a previous year, companies that end up on a newer list will cause the scraper
+# to jump up to the newer list.
+first_company = {2015:36631} # 2015 #1, Ultra Mobile
+# Ranked list of every company on a year's list, as served to the Inc. 5000 list pages
+inc5000_list_url = 'http://www.inc.com/inc5000list/json/inc5000_{year}.json'
+# Number of company requests in flight at once. The datarequests rate limit still applies.
+inc_workers = 8
+
+# Output columns and their types. Fields from the nested years list are named without their year
+# (ify_rank_2014 -> ify_rank) and suffixed _current or _prev, so lists from different years line up.
+inc5000_fields = [('list_year', 'int'), ('rank', 'int'), ('id', 'int'), ('ifc_company', 'str'), ('ifc_city', 'str'),
+                  ('ifc_state', 'str'), ('city_display_name', 'str'), ('address', 'str'), ('country', 'str'),
+                  ('metro_id', 'int'), ('metro_rank', 'int'), ('state_rank', 'int'), ('industry_id', 'int'),
+                  ('ifi_industry', 'str'), ('industry_rank', 'int'), ('current_industry_rank', 'int'),
+                  ('ifc_founded', 'int'), ('ifc_business_model', 'str'), ('revenue_range', 'str'),
+                  ('app_revenues_lastyear', 'float'), ('app_revenues_fouryearsago', 'float'),
+                  ('app_employ_lastyear', 'int'), ('app_employ_fouryearsago', 'int'), ('ceo', 'str'),
+                  ('description', 'str'), ('ifc_url', 'str'), ('twitter', 'str'), ('ifc_twitter_handle', 'str'),
+                  ('facebook', 'str'), ('linkedin', 'str'), ('ifc_filelocation', 'str'), ('next_id', 'int'),
+                  ('next_preview_text', 'str'), ('next_badge_url', 'str')]
+inc5000_year_fields = [('ify_year', 'int'), ('ify_rank', 'int'), ('ify_state_rank', 'int'), ('ify_metro_rank', 'int'),
+                       ('ify_industry_rank', 'int'), ('ify_revenue', 'float'), ('ify_revenue_previous', 'float'),
+                       ('ify_employee_count', 'int'), ('ify_employee_count_previous', 'int')]
+inc5000_schema = inc5000_fields + [(k+suffix, t) for suffix in ['_current', '_prev'] for k, t in inc5000_year_fields]
+# Fields written to the warehouse by getInc5000
+inc5000_warehouse_fields = ['rank', 'ify_revenue_current', 'ify_revenue_previous_current', 'ify_employee_count_current']
+
+def _fetchCompany(company_id, cache='ttl'):
+    '''
+    Returns (company_id, company data, error) for one company. Errors are returned rather than raised
+    so that one failed company does not stop the crawl.
+    '''
+    try:
+        current_company = datarequests.get('inc', 'http://www.inc.com/rest/inc5000company/'+str(company_id)+'/full_list', mode=cache).json()
+        return company_id, current_company['data'], None
+    except Exception as e:
+        return company_id, None, e
 
-def getInc5000(year):
-    # Set current_company_id equal to that of the #1 company for the current year's Inc. 5000 List
-    # If scraping a previous year, companies that end up on a newer list will cause the scraper
-    # to jump up to the newer list.
-    year_dict = 36631 # 2015 #1, Ultra Mobile
+def readCheckpoint(path):
+    '''
+    Yields the company data saved in a crawl checkpoint file, one company at a time.
+    '''
+    if os.path.exists(path):
+        with open(path) as f:
+            for line in f:
+                # A crawl stopped mid-write can leave a partial last line
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    pass
+
+def listInc5000(year, cache='ttl'):
+    '''
+    Returns the IDs of every company on a year's list in rank order, from the ranked list the Inc. 5000
+    list pages load, or an empty list if it cannot be fetched.
+    '''
+    try:
+        companies = datarequests.get('inc', inc5000_list_url.format(year=year), mode=cache).json()
+        return [c['id'] for c in sorted(companies, key=lambda c: c.get('rank') or 0)]
+    except Exception as e:
+        print 'Could not read the {} Inc. 5000 list, so the crawl follows next_id from the #1 company: {!r}'.format(year, e)
+        return []
+
+def seedsFromCheckpoint(path, n=inc_workers):
+    '''
+    Returns n company IDs spread evenly down the list from an earlier crawl checkpoint, to seed a new crawl
+    of the same list (e.g. a refresh into a new checkpoint) with n chains that each cover part of the list.
+    '''
+    ranked = sorted((c.get('rank') or 0, c['id']) for c in readCheckpoint(path))
+    if not ranked:
+        return []
+    step = max(1, len(ranked)//n)
+    return [company_id for rank, company_id in ranked[::step][:n]]
+
+def crawlInc5000(year, seeds=None, checkpoint=None, workers=inc_workers, cache='ttl'):
+    '''
+    Crawls the Inc. 5000 list for a year and saves every company, one JSON object per line, to a checkpoint file.
+    Several next_id chains are followed at once, starting from the seeds and from every next_id in the
+    checkpoint that has not been fetched yet. An interrupted crawl therefore resumes where it stopped,
+    and companies that failed are retried on the next run.
+    Without seeds, every company ID on the ranked list (listInc5000) is a seed, so even a first crawl keeps
+    workers requests in flight. If the list cannot be fetched, the crawl falls back to the single chain from
+    the #1 company, which is fetched one company at a time.
+    Returns the path of the checkpoint file.
+        parameters:
+            - year: Inc. 5000 list year
+            - seeds: company IDs to start from. Defaults to every company on the ranked list, or failing that
+                the #1 company in first_company. seedsFromCheckpoint gives seeds from an earlier crawl of the same list.
+            - checkpoint: path of the checkpoint file. Defaults to inc5000_<year>.jsonl in the datarequests data directory.
+            - workers: number of company requests in flight at once, at most one per chain
+            - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+    '''
+    checkpoint = checkpoint or os.path.join(datarequests.data_dir, 'inc5000_{}.jsonl'.format(year))
+    if not os.path.exists(os.path.dirname(os.path.abspath(checkpoint))):
+        os.makedirs(os.path.dirname(os.path.abspath(checkpoint)))
     
-    ''' Sample lists for dataframe headers'''
-    '''
-    key_list = [u'app_revenues_fouryearsago', u'city_display_name', u'twitter', u'app_employ_fouryearsago', u'rank',
-                u'app_revenues_lastyear', u'linkedin', u'ifc_filelocation', u'id', u'app_employ_lastyear',
-                u'ifc_twitter_handle', u'industry_id', u'ifc_business_model', u'ifc_url', u'next_id',
-                u'description', u'ifc_state', u'ceo', u'metro_id', u'revenue_range', u'facebook', u'next_preview_text',
-                u'industry_rank', u'address', u'next_badge_url', u'ifc_city', u'ifi_industry', u'country',
-                u'ifc_company', u'state_rank', u'metro_rank', u'current_industry_rank', u'ifc_founded']
-    years_list_current = ['ify_state_rank_2014', 'ify_employee_count_2014', 'ify_metro_rank_2014', 'ify_employee_count_previous_2014',
-                             'ify_industry_rank_2014', 'ify_revenue_previous_2014', 'ify_year_2014', 'ify_rank_2014', 'ify_revenue_2014']
-    years_list_prev = ['ify_state_rank_2013', 'ify_employee_count_2013', 'ify_metro_rank_2013', 'ify_employee_count_previous_2013',
-                       'ify_industry_rank_2013', 'ify_revenue_previous_2013', 'ify_year_2013', 'ify_rank_2013', 'ify_revenue_2013']
-    '''
-    # Create empty lists for eventual pandas column names
-    key_list, years_list_current, years_list_prev = [], [], []
-    # Create empt list that all company data will be appended to
-    all_co_data_list = []
+    done = set()
+    pending = deque(seeds or listInc5000(year, cache) or ([first_company[year]] if year in first_company else []))
+    for company in readCheckpoint(checkpoint):
+        done.add(company['id'])
+        pending.append(company.get('next_id'))
+    if not pending:
+        print 'No starting company for {}. Pass the ID of the #1 company as seeds.'.format(year)
+        return checkpoint
     
-    # Loop through the Inc. 5000
-    # Company #5000 has no next_id value, so the loop will end
-    while current_company_id:
-        # Get company data as JSON
-        current_company = requests.get('http://www.inc.com/rest/inc5000company/'+str(current_company_id)+'/full_list').json()
-        
-        # Extract company data to lists
-        current_co_data = []
-        current_co_years_data = []
-        for key in current_company['data']:
-            if key != 'years':
-                current_co_data.append(current_company['data']['%s' % key])
-            elif key == 'years':
-                for k in current_company['data']['years'][0]:
-                    current_co_years_data.append(current_company['data']['years'][0]['%s' % k])
-                if len(current_company['data']['years']) > 1:
-                    for k in current_company['data']['years'][1]:
-                        current_co_years_data.append(current_company['data']['years'][1]['%s' % k])
-                    
-        # Set the current_company_id equal to the next id so it actually iterates
-        current_company_id = current_company['data']['next_id']
-                    
-        # Combine lists and add it to the list of lists holding all company data
-        company_data = current_co_data + current_co_years_data
-        all_co_data_list.append(company_data)
+    queued = set()
+    failed = []
+    results = Queue()
+    pool = ThreadPool(workers)
+    in_flight = 0
+    with open(checkpoint, 'a') as f:
+        while pending or in_flight:
+            # Keep the pool full with companies not yet fetched
+            while pending and in_flight < workers:
+                company_id = pending.popleft()
+                if company_id and company_id not in done and company_id not in queued:
+                    queued.add(company_id)
+                    pool.apply_async(_fetchCompany, (company_id, cache), callback=results.put)
+                    in_flight += 1
+            if not in_flight:
+                break
+            
+            company_id, company, error = results.get()
+            in_flight -= 1
+            if error is not None:
+                failed.append(company_id)
+                continue
+            
+            f.write(json.dumps(company)+'\n')
+            f.flush()
+            done.add(company['id'])
+            # Company #5000 has no next_id value, so its chain ends
+            pending.append(company.get('next_id'))
+    pool.close()
+    
+    if failed:
+        print '{} companies could not be fetched and will be retried on the next run: {}'.format(len(failed), failed)
+    
+    return checkpoint
+
+def _flattenCompany(company, year):
+    '''
+    Flattens one company's data into a dictionary keyed by schema field name.
+    '''
+    record = dict((k, v) for k, v in company.items() if k != 'years')
+    record['list_year'] = year
+    for suffix, years in zip(['_current', '_prev'], company.get('years', [])):
+        for k, v in years.items():
+            # Drop the year from names like ify_rank_2014
+            k = k.rsplit('_', 1)[0] if k.rsplit('_', 1)[-1].isdigit() else k
+            record[k+suffix] = v
+    return record
+
+def _typeFrame(df, schema):
+    '''
+    Casts the columns of a dataframe to the types in a schema. Ints are nullable, since many fields are optional.
+    '''
+    for k, t in schema:
+        if t in ['int', 'float']:
+            values = df[k]
+            if not pd.api.types.is_numeric_dtype(values):
+                # Revenues and counts can arrive as text, e.g. '1,234,567'
+                values = values.astype(object).map(lambda v: v.replace('$', '').replace(',', '') if isinstance(v, (str, text_type)) else v)
+            values = pd.to_numeric(values, errors='coerce')
+            df[k] = values.round().astype('Int64') if t == 'int' else values.astype(float)
+        else:
+            # Held as unicode objects, since names need not be ASCII
+            df[k] = df[k].astype(object).map(lambda v: v if pd.isnull(v) else text_type(v))
+    return df
+
+class RecordWriter(object):
+    '''
+    Streams records to disk in chunks with a fixed schema, so memory stays flat however many records are written.
+        parameters:
+            - path: CSV file, or directory of Parquet part files when fmt='parquet'
+            - schema: list of (field, type) pairs, with types 'int', 'float' or 'str'. Fields not in the schema are dropped.
+            - chunk_size: number of records buffered before a chunk is written
+            - fmt: 'csv' or 'parquet' (requires pyarrow or fastparquet)
+    '''
+    def __init__(self, path, schema, chunk_size=500, fmt='csv'):
+        self.path = path
+        self.schema = schema
+        self.columns = [k for k, t in schema]
+        self.chunk_size = chunk_size
+        self.fmt = fmt
+        self.parts = 0
+        self._buffer = []
         
-    # Makes a list of eventual pandas headers
-    key_list = list(current_company['data'].keys())
-    key_list.remove('years')
-    # Makes a list from nested elements of company data for more pandas headers
-    years_list_current = []
-    for i in list(current_company['data']['years'][0]):
-        years_list_current.append(str(i)+'_current')
-    if len(current_company['data']['years']) > 1:
-        years_list_prev = []
-        for i in current_company['data']['years'][1]:
-            years_list_prev.append(str(i)+'_prev')
+    def write(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= self.chunk_size:
+            self.flush()
             
-    # Create a dataframe from the long list
-    inc5000 = pd.DataFrame(all_co_data_list)
-<<<<<<< HEAD
-    # inc5000 = inc5000.T.reset_index(drop=True) # No need to transpose; the df is constructed properly
-=======
->>>>>>> origin/master
-    # Rename columns by simply replacing them with the list of columns created by the last company to loop
-    inc5000.columns = [key_list+years_list_current+years_list_prev]
+    def flush(self):
+        if not self._buffer:
+            return
+        df = _typeFrame(pd.DataFrame.from_records(self._buffer, columns=self.columns), self.schema)
+        if self.fmt == 'parquet':
+            if not os.path.exists(self.path):
+                os.makedirs(self.path)
+            df.to_parquet(os.path.join(self.path, 'part-{:05d}.parquet'.format(self.parts)), index=False)
+        else:
+            df.to_csv(self.path, mode='a' if self.parts else 'w', header=not self.parts, index=False, encoding='utf-8')
+        self.parts += 1
+        self._buffer = []
+        
+    def close(self):
+        self.flush()
+        
+    def chunks(self):
+        '''
+        Yields the written records as typed dataframes, one chunk at a time.
+        '''
+        if self.fmt == 'parquet':
+            for i in range(self.parts):
+                yield pd.read_parquet(os.path.join(self.path, 'part-{:05d}.parquet'.format(i)))
+        elif self.parts:
+            for df in pd.read_csv(self.path, chunksize=self.chunk_size, dtype=str, encoding='utf-8'):
+                yield _typeFrame(df, self.schema)
+                
+    def frame(self):
+        '''
+        Builds a single dataframe from the written chunks.
+        '''
+        chunks = list(self.chunks())
+        return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=self.columns)
+
+def getInc5000(year, seeds=None, checkpoint=None, workers=inc_workers, cache='ttl', output=None, fmt='csv', store=None):
+    '''
+    Crawls (or resumes crawling) the Inc. 5000 list for a year, streams the companies to a typed
+    CSV or Parquet output with the columns in inc5000_schema, and returns it as a dataframe sorted by rank.
+    Parameters are as for crawlInc5000, plus:
+        - output: path of the output file (CSV) or directory (Parquet). Defaults to inc5000_<year>.csv
+            or inc5000_<year>/ in the datarequests data directory.
+        - fmt: 'csv' or 'parquet'
+        - store: optional warehouse.Warehouse to also write each company's rank, revenue and employees into,
+            as series <company id>/<field> keyed by state
+    '''
+    with datarequests.stage('inc', 'getInc5000', 'fetch'):
+        checkpoint = crawlInc5000(year, seeds, checkpoint, workers, cache)
+    
+    output = output or os.path.join(datarequests.data_dir, 'inc5000_{}'.format(year)+('.csv' if fmt == 'csv' else ''))
+    with datarequests.stage('inc', 'getInc5000', 'parse'):
+        writer = RecordWriter(output, inc5000_schema, fmt=fmt)
+        written = set()
+        for company in readCheckpoint(checkpoint):
+            if company['id'] not in written:
+                written.add(company['id'])
+                writer.write(_flattenCompany(company, year))
+        writer.close()
+    
+    with datarequests.stage('inc', 'getInc5000', 'assemble'):
+        df = writer.frame().sort_values('rank').reset_index(drop=True)
+    if store is not None:
+        for field in inc5000_warehouse_fields:
+            store.write(pd.DataFrame({'series':df.id.astype(str)+'/'+field, 'geo':crosswalk.geoKeys(df.ifc_state.fillna('')),
+                                      'period':df.list_year, 'value':df[field].astype(float)}), 'inc')
     
-    return inc5000
+    return df
     
-# Example: getInc5000(2014)
+# Example: getInc5000(2015)
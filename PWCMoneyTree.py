@@ -5,112 +5,223 @@ Spyder Editor
 This is a temporary script file.
 """
 
-import requests
-import json
 import pandas as pd
-import time
-import matplotlib.pyplot as plt
+import datarequests
+from geography import crosswalk
+from multiprocessing.dummy import Pool as ThreadPool
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
 
 states = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA', 'HI', 'ID',
           'IL', 'IN', 'IA', 'KS', 'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO',
           'MT', 'NE', 'NV', 'NJ', 'NH', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA',
           'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']                           
+# Default for getVC, whose states parameter shadows the list above
+all_states = states
 
-def getVC_all_states(year1, year2, industry):
+industry_lookup={'All Industries':'', 'Biotechnology':'4000', 'Business Products and Services':'9300', 'Computers and Peripherals':'2200',
+                 'Consumer Products and Services':'7400', 'Electronics/Instrumentation':'3400', 'Financial Services':'9200',
+                 'Healthcare Services':'5400', 'Industrial/Energy':'6000', 'IT Services':'2600', 'Media and Entertainment':'7100',
+                 'Medical Devices and Equipment':'5100', 'Networking and Equipment':'1500', 'Other':'9900', 'Retailing/Distribition':'7200',
+                 'Semiconductors':'3300', 'Software':'2700', 'Telecommunications':'1200'}
+# Number of MoneyTree requests in flight at once. Requests are also held to datarequests.rate_limits['pwc'].
+vc_workers = 8
+
+def _fetchVC(year1, year2, industry, state, cache='ttl'):
     '''
-        Fetches PricewaterhouseCoopers MoneyTree venture capital historical data for a PWC-defined industry over a period of time. Data is collected for Q1 to Q4 of the years passed as arguments.
+        Fetches quarterly MoneyTree data for one industry in one state. Returns None if there is no data.
+    '''
+    response = datarequests.post('pwc', 'https://www.pwcmoneytree.com/HistoricTrends/GetJSONHistTrendWithParams',
+                                 headers={},
+                        data={'Qtr2':'{}-4'.format(year2), 'Qtr1':'{}-1'.format(year1), 'CompanyIndustry':'{}'.format(industry_lookup[industry]), 
+                              'CompanyState':'{}'.format(state), 'DrillDownSequence':'Qtr:'}, mode=cache)
+    
+    try:
+        if len(response.json())>0:
+            state_df = pd.DataFrame(response.json())
+            state_df.rename(columns={'XAxisTic':'period', 'YBar':'dollars', 'YLine':'deals'}, inplace=True)
+            state_df['state'] = state
+            state_df['industry'] = industry
+            return state_df[['period', 'state', 'industry', 'dollars', 'deals']]
+    except (ValueError, KeyError):
+        print 'No dataframe created for {industry} in {state}'.format(industry=industry, state=state)
+    return None
+
+def getVC(year1, year2, industries=None, states=None, workers=None, cache='ttl', store=None):
+    '''
+        Fetches PricewaterhouseCoopers MoneyTree venture capital historical data for any number of industries and states at once.
+        Data is collected for Q1 to Q4 of the years passed as arguments. Returns one tidy dataframe with a row per
+        industry, state and quarter, and categorical state and industry columns.
         Parameters:
             - year1: The first year of interest
             - year2: The last year of interest
-            - industry: Industry name as recognized by PricewaterhouseCoopers MoneyTree
-        
-        Accepted industry arguments are: All Industries, Biotechnology, Business Products and Services, Computers and Peripherals, Consumer Products and Services, Electronics/Instrumentation, Financial Services, Healthcare Services, Industrial/Energy, IT Services, Media and Entertainment, Medical Devices and Equipment, Networking and Equipment, Other, Retailing/Distribition, Semiconductors, Software, and Telecommunications.
+            - industries: list of industry names as recognized by PricewaterhouseCoopers MoneyTree, see industry_lookup.
+                Defaults to ['All Industries'].
+            - states: list of state abbreviations. Defaults to all states.
+            - workers: number of requests in flight at once. Defaults to vc_workers.
+            - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+            - store: optional warehouse.Warehouse to also write the data into, as series <industry>/dollars and <industry>/deals
     '''
-    month_lookup = pd.DataFrame({1:2, 2:5, 3:8, 4:11},index=[0]).T.reset_index().rename(columns={'index':'quarter', 0:'month'})
-    industry_lookup={'All Industries':'', 'Biotechnology':'4000', 'Business Products and Services':'9300', 'Computers and Peripherals':'2200',
-                     'Consumer Products and Services':'7400', 'Electronics/Instrumentation':'3400', 'Financial Services':'9200',
-                     'Healthcare Services':'5400', 'Industrial/Energy':'6000', 'IT Services':'2600', 'Media and Entertainment':'7100',
-                     'Medical Devices and Equipment':'5100', 'Networking and Equipment':'1500', 'Other':'9900', 'Retailing/Distribition':'7200',
-                     'Semiconductors':'3300', 'Software':'2700', 'Telecommunications':'1200'}
+    industries = industries or ['All Industries']
+    states = states or all_states
+    tasks = [(industry, state) for industry in industries for state in states]
     
-    states_dfs = []
+    with datarequests.stage('pwc', 'getVC', 'fetch'):
+        pool = ThreadPool(workers or vc_workers)
+        try:
+            frames = pool.map(lambda t: _fetchVC(year1, year2, t[0], t[1], cache), tasks)
+        finally:
+            pool.close()
     
-    for state in states:
-        response = requests.post('https://www.pwcmoneytree.com/HistoricTrends/GetJSONHistTrendWithParams',
-                                 headers={},
-                            data={'Qtr2':'{}-4'.format(year2), 'Qtr1':'{}-1'.format(year1), 'CompanyIndustry':'{}'.format(industry_lookup[industry]), 
-                                  'CompanyState':'{}'.format(state), 'DrillDownSequence':'Qtr:'})
-                                  
-        if len(response.json())>0:
-            try:
-                state_df = pd.DataFrame(response.json())
-                state_df.rename(columns={'XAxisTic':'period', 'YBar':'dollars', 'YLine':'deals'}, inplace=True)
-                state_df['state'] = state
-                # Add year
-                state_df['year'] = state_df.period.str.split('-').str.get(0).astype(int)
-                # Add month
-                state_df['quarter'] = state_df.period.str.split('-').str.get(1).astype(int)
-                
-                '''
-                state_df = pd.merge(state_df, month_lookup, on='quarter', how='left')
-                # Add datetime
-                print state_df.head(1)
-                state_df['date'] = pd.to_datetime((state_df.year*10000)+(state_df.month*100)+01, format='%Y%m%d')
-                '''
-                
-                states_dfs.append(state_df)
-            except:
-                print 'No dataframe created for {}'.format(state)
-                
-        time.sleep(0.25)
-        
-    vc = pd.concat(states_dfs)
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        raise ValueError('No MoneyTree data for {} in {} from {} to {}'.format(', '.join(industries), ', '.join(states), year1, year2))
     
-    vc = pd.merge(vc, month_lookup, on='quarter', how='inner')
-    vc['date'] = pd.to_datetime(vc.year*10000+vc.month*100+01, format='%Y%m%d')
+    with datarequests.stage('pwc', 'getVC', 'assemble'):
+        vc = pd.concat(frames, ignore_index=True)
+        
+        # Periods are 'year-quarter'. Each quarter is dated at its middle month.
+        period = vc.period.str.split('-')
+        vc['year'] = period.str.get(0).astype(int)
+        vc['quarter'] = period.str.get(1).astype(int)
+        vc['date'] = pd.to_datetime(vc.year*10000+((vc.quarter-1)*3+2)*100+1, format='%Y%m%d')
+        
+        vc['state'] = pd.Categorical(vc.state, categories=states)
+        vc['industry'] = pd.Categorical(vc.industry, categories=industries)
     
-    vc['industry'] = industry
+    if store is not None:
+        for measure in ['dollars', 'deals']:
+            store.write(pd.DataFrame({'series':vc.industry.astype(str)+'/'+measure, 'geo':crosswalk.geoKeys(vc.state.astype(str)),
+                                      'period':vc.date, 'value':vc[measure]}), 'pwc')
     
-    vc[['date', 'state', 'dollars', 'deals', 'year', 'quarter', 'industry',]]
+    return vc[['date', 'state', 'industry', 'year', 'quarter', 'dollars', 'deals']]
+
+def getVC_all_states(year1, year2, industry, cache='ttl'):
+    '''
+        Fetches PricewaterhouseCoopers MoneyTree venture capital historical data for a PWC-defined industry over a period of time. Data is collected for Q1 to Q4 of the years passed as arguments.
+        Parameters:
+            - year1: The first year of interest
+            - year2: The last year of interest
+            - industry: Industry name as recognized by PricewaterhouseCoopers MoneyTree
+            - cache: response cache mode ('ttl', 'refresh', 'offline', 'off'), see datarequests
+        
+        Accepted industry arguments are: All Industries, Biotechnology, Business Products and Services, Computers and Peripherals, Consumer Products and Services, Electronics/Instrumentation, Financial Services, Healthcare Services, Industrial/Energy, IT Services, Media and Entertainment, Medical Devices and Equipment, Networking and Equipment, Other, Retailing/Distribition, Semiconductors, Software, and Telecommunications.
+    '''
+    return getVC(year1, year2, [industry], cache=cache)
     
-    return vc
+class VCCube(object):
+    '''
+        Venture capital dollars and deals pre-aggregated by (industry, state, year, quarter), so that
+        comparisons across industries, states and periods read from the aggregate instead of regrouping raw data.
+        Parameters:
+            - df: dataframe of venture capital information, as returned by getVC(). Optional; data can be added with update().
+        
+        Example:
+            cube = VCCube(getVC(2010, 2015, list(industry_lookup)))
+            cube.rollup(['industry', 'year'])                     # totals by industry and year
+            cube.top(5, 'dollars', by='state', within='industry') # top 5 states in each industry
+            cube.update(getVC(2016, 2016, list(industry_lookup))) # add a new quarter or year
+    '''
+    dims = ['industry', 'state', 'year', 'quarter']
+    measures = ['dollars', 'deals']
     
+    def __init__(self, df=None):
+        index = pd.MultiIndex.from_arrays([[] for d in self.dims], names=self.dims)
+        self.cube = pd.DataFrame({m:[] for m in self.measures}, index=index)[self.measures]
+        self._rollups = {}
+        if df is not None:
+            self.update(df)
+            
+    def update(self, df):
+        '''
+            Adds new data to the cube. Cells already in the cube (e.g. a revised quarter) are replaced.
+        '''
+        df = df.assign(industry=df.industry.astype(str), state=df.state.astype(str))
+        new = df.groupby(self.dims)[self.measures].sum()
+        self.cube = pd.concat([self.cube[~self.cube.index.isin(new.index)], new]).sort_index()
+        self._rollups = {}
+        
+    def _select(self, filters):
+        cube = self.cube
+        for k, v in filters.items():
+            cube = cube[cube.index.get_level_values(k).isin(v if isinstance(v, (list, tuple, set)) else [v])]
+        return cube
+        
+    def rollup(self, by, **filters):
+        '''
+            Totals dollars and deals by any of industry, state, year and quarter.
+            Keyword arguments filter the cube first, e.g. rollup(['state'], industry='Software', year=[2014, 2015]).
+            Unfiltered roll-ups are kept until the cube is next updated.
+        '''
+        by = [by] if isinstance(by, string_types) else list(by)
+        if not filters and tuple(by) in self._rollups:
+            return self._rollups[tuple(by)]
+        r = self._select(filters).groupby(level=by).sum()
+        if not filters:
+            self._rollups[tuple(by)] = r
+        return r
+        
+    def ranks(self, by='state', within=None, **filters):
+        '''
+            Roll-up by the by and within dimensions, with dollars_rank and deals_rank of each by-value
+            within each within-group, e.g. ranks('state', within='industry').
+        '''
+        within = [] if within is None else ([within] if isinstance(within, string_types) else list(within))
+        by = [by] if isinstance(by, string_types) else list(by)
+        r = self.rollup(within+by, **filters).copy()
+        for m in self.measures:
+            r[m+'_rank'] = r.groupby(level=within)[m].rank(ascending=False) if within else r[m].rank(ascending=False)
+        return r
+        
+    def top(self, n=5, measure='dollars', by='state', within=None, **filters):
+        '''
+            Top n values of by for a measure, within each within-group if given.
+        '''
+        within = [] if within is None else ([within] if isinstance(within, string_types) else list(within))
+        by = [by] if isinstance(by, string_types) else list(by)
+        r = self.rollup(within+by, **filters).sort_values(measure, ascending=False)
+        return r.groupby(level=within, sort=False).head(n).sort_index(level=within, sort_remaining=False) if within else r.head(n)
+
 def compare_states(df, plot=False):
     '''
         Takes a dataframe of venture capital investment in a single industry and compares the total investment and deals over the time period covered by the dataframe among all states. Optionally produces a bar plot with two subplots showing the top 5 states for dollars and deals in this industry.
         Parameters:
-            - df: dataframe of venture capital information. Set up to work smoothly with dataframes returned by getVC_allstates()
+            - df: dataframe of venture capital information, or a VCCube. Set up to work smoothly with dataframes returned by getVC_allstates()
             - plot: optional argument for producing a plot of the top 5 states for venture capital
     '''
-    if len(df.industry.unique()) > 1:
+    cube = df if isinstance(df, VCCube) else VCCube(df)
+    industries = cube.cube.index.get_level_values('industry').unique()
+    years = cube.cube.index.get_level_values('year')
+    if len(industries) > 1:
         print 'Dataframe must be limited to a single industry.'
     
-    comp = df.groupby(['state']).sum().reset_index()
-    
-    comp['dollars_rank'] = comp.dollars.rank(ascending=False)
-    comp['deals_rank'] = comp.deals.rank(ascending=False)
+    comp = cube.ranks('state').reset_index()
     
     if plot==True:
+        # Only imported when a chart is drawn, so headless pulls start fast
+        import matplotlib.pyplot as plt
         fig, (ax1, ax2) = plt.subplots(1,2, figsize=(9,5))
         # top 5 states for vc investment
-        ax1.bar(range(0,5), comp.sort('dollars', ascending=False).dollars.values[0:5],
+        ax1.bar(range(0,5), comp.sort_values('dollars', ascending=False).dollars.values[0:5],
                 linewidth=0, align='center', zorder=2)
         ax1.set_xticks([i+1 for i in ax1.get_xticks().tolist()])
-        ax1.set_xticklabels(comp.sort('dollars',ascending=False).state.values[0:5], ha='center')
+        ax1.set_xticklabels(comp.sort_values('dollars', ascending=False).state.values[0:5], ha='center')
         ax1.set_yticklabels(['$'+format(l/1000000, ',').split('.')[0] for l in ax1.get_yticks().tolist()])
         ax1.set_ylabel('Millions of Dollars')
-        ax1.set_title('Top 5 States for\n{industry} Venture Capital Investment\n{year1}-{year2}'.format(industry=df.industry.unique()[0], year1=min(df.year.unique()), year2=max(df.year.unique())),
+        ax1.set_title('Top 5 States for\n{industry} Venture Capital Investment\n{year1}-{year2}'.format(industry=industries[0], year1=min(years), year2=max(years)),
                       fontsize=10)
         ax1.set_xlim(-1,5)
         ax1.grid(True, which='major', axis='y', zorder=-1)
         # top 5 states for deals
-        ax2.bar(range(0,5), comp.sort('deals', ascending=False).deals.values[0:5],
+        ax2.bar(range(0,5), comp.sort_values('deals', ascending=False).deals.values[0:5],
                 linewidth=0, align='center', zorder=2)
         ax2.set_xticks([i+1 for i in ax2.get_xticks().tolist()])
-        ax2.set_xticklabels(comp.sort('deals',ascending=False).state.values[0:5], ha='center')
+        ax2.set_xticklabels(comp.sort_values('deals', ascending=False).state.values[0:5], ha='center')
         ax2.set_yticklabels([format(l, ',').split('.')[0] for l in ax2.get_yticks().tolist()])
         ax2.set_ylabel('Number of Deals')
-        ax2.set_title('Top 5 States for\n{industry} Venture Capital Deals\n{year1}-{year2}'.format(industry=df.industry.unique()[0], year1=min(df.year.unique()), year2=max(df.year.unique())),
+        ax2.set_title('Top 5 States for\n{industry} Venture Capital Deals\n{year1}-{year2}'.format(industry=industries[0], year1=min(years), year2=max(years)),
                       fontsize=10)
         ax2.set_xlim(-1,5)
         ax2.grid(True, which='major', axis='y', zorder=-1)
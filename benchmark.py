@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 17:26:45 2026
+
+Benchmarks the fetchers against a local stand-in for the Census, BLS, BEA, PWC MoneyTree and Inc. 5000 APIs,
+so throughput can be measured and regressions caught without network access.
+
+The stand-in server answers with synthetic payloads shaped like each API's responses, after a configurable
+latency, or replays recorded responses from a datarequests response cache. To record fixtures, run the
+fetchers against the real APIs once and pass the cache file (responses.sqlite in datarequests.data_dir)
+as fixtures=.
+
+Each scenario reports:
+    - wall: seconds from call to return
+    - requests: requests the server answered
+    - parse: seconds with no request in flight, i.e. time spent building dataframes rather than waiting on the network
+    - peak_mb: peak memory allocated during the scenario (Python 3 only)
+
+Examples:
+    run()                                         # every scenario in the scenarios list
+    run(['ACS 5 variables', 'ACS 50 variables'], latency=0.2)
+    python benchmark.py --save baseline.csv
+    python benchmark.py --baseline baseline.csv   # flags scenarios that got slower
+"""
+
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import pandas as pd
+import datarequests
+import ACSdatarequests
+import BLSdatarequests
+import BEAdatarequests
+import PWCMoneyTree
+import Inc5000_scraper
+from geography import crosswalk
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlsplit, parse_qsl
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlsplit, parse_qsl
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+sources = ['census', 'bls', 'bea', 'pwc', 'inc']
+
+def _censusPayload(path, query, body, size):
+    '''
+    Header row and one row per geography for a Census API call.
+    '''
+    variables = query['get'].split(',')
+    geo = query['for'].split(':')[0]
+    within = [c.split(':') for c in query.get('in', '').split(' ') if c]
+    if geo == 'us':
+        codes = ['1']
+    elif geo == 'metropolitan statistical area/micropolitan statistical area':
+        # Real metros first, so peer group lookups find their members
+        codes = [str(c) for c in crosswalk.index('msa').index][:size]
+        codes += [str(90000+i) for i in range(size-len(codes))]
+    else:
+        codes = [str(i+1).zfill(ACSdatarequests.census_geo_widths.get(geo, 3)) for i in range(size)]
+    rows = [variables+[k for k, v in within]+[geo]]
+    for code in codes:
+        rows.append([('Area '+code if v == 'NAME' else '{:.1f}'.format(random.uniform(0, 100000))) for v in variables]
+                    +[v for k, v in within]+[code])
+    return rows
+
+def _blsPayload(path, query, body, size):
+    '''
+    Monthly observations, plus annual averages if asked for, for every series in a BLS query.
+    '''
+    body = json.loads(body)
+    series = []
+    for sid in body['seriesid']:
+        data = []
+        for year in range(int(body['endyear']), int(body['startyear'])-1, -1):
+            if body.get('annualaverage') == 'true':
+                data.append({'year':str(year), 'period':'M13', 'periodName':'Annual', 'value':'5.0', 'footnotes':[{}]})
+            for month in range(12, 0, -1):
+                data.append({'year':str(year), 'period':'M{:02d}'.format(month), 'periodName':'Month',
+                             'value':'{:.1f}'.format(random.uniform(2, 12)), 'footnotes':[{}]})
+        series.append({'seriesID':sid, 'data':data})
+    return {'status':'REQUEST_SUCCEEDED', 'responseTime':1, 'message':[], 'Results':{'series':series}}
+
+def _beaPayload(path, query, body, size):
+    '''
+    Regional data for size metros, or size lines of a NIPA table.
+    '''
+    query = dict((k.lower(), v) for k, v in query.items())
+    data = []
+    if query.get('datasetname') == 'RegionalData':
+        codes = list(crosswalk.index('msa').index)[:size]
+        codes += [90000+i for i in range(size-len(codes))]
+        for code in codes:
+            for year in range(2001, 2015):
+                data.append({'GeoFips':str(code), 'GeoName':'Area {}, MD (Metropolitan Statistical Area)'.format(code),
+                             'TimePeriod':str(year), 'DataValue':'{:,.0f}'.format(random.uniform(1000, 100000)),
+                             'CL_UNIT':'Thousands of dollars', 'UNIT_MULT':'3'})
+    else:
+        periods = {'A':[''], 'Q':['Q1', 'Q2', 'Q3', 'Q4'], 'M':['M{:02d}'.format(m) for m in range(1, 13)]}[query.get('frequency', 'A')]
+        for line in range(1, size+1):
+            for year in query.get('year', '2014').split(','):
+                for period in periods:
+                    data.append({'TableName':query.get('tableid', ''), 'SeriesCode':'S{}'.format(line), 'LineNumber':str(line),
+                                 'LineDescription':'Line {}'.format(line), 'TimePeriod':year+period,
+                                 'DataValue':'{:,.1f}'.format(random.uniform(1000, 100000)), 'NoteRef':''})
+    return {'BEAAPI':{'Request':{}, 'Results':{'Data':data}}}
+
+def _pwcPayload(path, query, body, size):
+    '''
+    Quarterly dollars and deals for the quarters in a MoneyTree request.
+    '''
+    form = dict(parse_qsl(body))
+    first, last = int(form['Qtr1'].split('-')[0]), int(form['Qtr2'].split('-')[0])
+    return [{'XAxisTic':'{}-{}'.format(year, quarter), 'YBar':random.uniform(0, 1e8), 'YLine':random.randint(0, 50)}
+            for year in range(first, last+1) for quarter in range(1, 5)]
+
+def _incPayload(path, query, body, size):
+    '''
+    One company, pointing to the next so that the list is size companies long, or the ranked list of all of them.
+    '''
+    if path.endswith('.json'):
+        return [{'id':Inc5000_scraper.first_company[2015]+i, 'rank':i+1} for i in range(size)]
+    company_id = int(path.rstrip('/').split('/')[-2])
+    rank = company_id-Inc5000_scraper.first_company[2015]+1
+    return {'data':{'id':company_id, 'rank':rank, 'next_id':company_id+1 if rank < size else None,
+                    'ifc_company':'Company {}'.format(company_id), 'ifc_state':random.choice(PWCMoneyTree.states),
+                    'app_revenues_lastyear':'{:,.0f}'.format(random.uniform(1e6, 1e8)), 'app_employ_lastyear':random.randint(5, 500),
+                    'years':[{'ify_rank_2015':rank, 'ify_revenue_2015':random.uniform(1e6, 1e8)},
+                             {'ify_rank_2014':rank+100, 'ify_revenue_2014':random.uniform(1e6, 1e8)}]}}
+
+payloads = {'census':_censusPayload, 'bls':_blsPayload, 'bea':_beaPayload, 'pwc':_pwcPayload, 'inc':_incPayload}
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._respond('')
+
+    def do_POST(self):
+        self._respond(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8'))
+
+    def _respond(self, body):
+        status, content = self.server.stand_in.respond(self.command, self.path, body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+class StandInServer(object):
+    '''
+    Local HTTP server standing in for the data providers. Requests redirected to it with datarequests.redirect()
+    arrive as /<source>/<scheme>/<host>/<path>, and are answered with a recorded response or a synthetic payload.
+        parameters:
+            - latency: seconds each response is held back, to mimic the providers' response times
+            - size: geographies, NIPA lines or Inc. 5000 companies in synthetic payloads
+            - fixtures: optional datarequests response cache file whose responses are replayed when they match a request
+    '''
+    def __init__(self, latency=0.05, size=400, fixtures=None):
+        self.latency = latency
+        self.size = size
+        self.fixtures = datarequests.ResponseCache(fixtures) if fixtures else None
+        self.intervals = []
+        self._lock = threading.Lock()
+        self._server = None
+
+    def respond(self, method, path, body):
+        start = time.time()
+        source, scheme, rest = path.lstrip('/').split('/', 2)
+        parts = urlsplit(scheme+'://'+rest)
+        content = None
+        if self.fixtures is not None:
+            data = dict(parse_qsl(body)) if body and not body.startswith('{') else body
+            cached = self.fixtures.get(datarequests.requestKey(method, parts.geturl(), data=data or None), source, mode='offline')
+            content = cached.content if cached is not None else None
+        if content is None:
+            query = dict(parse_qsl(parts.query, keep_blank_values=True))
+            content = json.dumps(payloads[source](parts.path, query, body, self.size)).encode('utf-8')
+        time.sleep(self.latency)
+        with self._lock:
+            self.intervals.append((start, time.time()))
+        return 200, content
+
+    def start(self):
+        self._server = _ThreadingServer(('127.0.0.1', 0), _StandInHandler)
+        self._server.stand_in = self
+        threading.Thread(target=self._server.serve_forever).start()
+        base = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+        for source in sources:
+            datarequests.redirect(source, base+'/'+source)
+        return self
+
+    def stop(self):
+        for source in sources:
+            datarequests.redirect(source)
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset(self):
+        with self._lock:
+            self.intervals = []
+
+    def busy(self):
+        '''
+        Seconds during which at least one request was in flight.
+        '''
+        with self._lock:
+            intervals = sorted(self.intervals)
+        busy, end = 0., None
+        for s, e in intervals:
+            if end is None or s > end:
+                busy += e-s
+                end = e
+            elif e > end:
+                busy += e-end
+                end = e
+        return busy
+
+def _blsSeries(n):
+    return dict(('LAUMT{:02d}{:05d}00000003'.format(i%50+1, 10000+i), 'Area {}'.format(i)) for i in range(n))
+
+# Scenarios as (name, synthetic payload size, function of a scratch directory). Every call bypasses the response cache.
+scenarios = [('ACS 5 variables', 400, lambda d: ACSdatarequests.getACSData(['DP03_00{:02d}E'.format(i) for i in range(5)], 'msa', 2014, cache='off')),
+             ('ACS 50 variables', 400, lambda d: ACSdatarequests.getACSData(['DP03_00{:02d}E'.format(i) for i in range(50)], 'msa', 2014, cache='off')),
+             ('BLS 25 series', 0, lambda d: BLSdatarequests.getBLSData('Other', 'Other', 2005, 2014, series_dict=_blsSeries(25), cache='off')),
+             ('BLS 400 series', 0, lambda d: BLSdatarequests.getBLSData('Other', 'Other', 2005, 2014, series_dict=_blsSeries(400), cache='off')),
+             ('BEA regional GMP', 400, lambda d: BEAdatarequests.getBEAData('RegionalData', 'GMP', cache='off')),
+             ('BEA NIPA quarterly', 30, lambda d: BEAdatarequests.getBEAData('NIPA', table_id='T10101', freq='Q', cache='off')),
+             ('VC all states', 0, lambda d: PWCMoneyTree.getVC_all_states(2005, 2015, 'Software', cache='off')),
+             ('Inc. 5000 top 200', 200, lambda d: Inc5000_scraper.getInc5000(2015, checkpoint=os.path.join(d, 'inc.jsonl'),
+                                                                             output=os.path.join(d, 'inc.csv'), cache='off'))]
+
+def run(names=None, latency=0.05, fixtures=None, throttle=False):
+    '''
+    Runs benchmark scenarios against the stand-in server and returns a dataframe of wall time, request count,
+    parse time and peak memory per scenario.
+        parameters:
+            - names: scenario names to run. Defaults to every scenario.
+            - latency: seconds the server holds back each response
+            - fixtures: optional response cache file to replay recorded responses from
+            - throttle: whether to keep the providers' rate limits. Off by default, so the fetchers themselves are measured.
+    '''
+    server = StandInServer(latency, fixtures=fixtures).start()
+    limits = dict(datarequests.rate_limits)
+    quota = BLSdatarequests.bls_quota
+    scratch = tempfile.mkdtemp()
+    # Benchmark queries must not count against the real daily BLS limit
+    BLSdatarequests.bls_quota = BLSdatarequests.BLSQuota(os.path.join(scratch, 'bls_quota.json'))
+    if not throttle:
+        for source in sources:
+            datarequests.setRateLimit(source, 1e6)
+
+    results = []
+    try:
+        for name, size, fn in scenarios:
+            if names and name not in names:
+                continue
+            server.size = size
+            server.reset()
+            if tracemalloc:
+                tracemalloc.start()
+            start = time.time()
+            fn(scratch)
+            wall = time.time()-start
+            peak = tracemalloc.get_traced_memory()[1]/1024.**2 if tracemalloc else float('nan')
+            if tracemalloc:
+                tracemalloc.stop()
+            results.append({'scenario':name, 'wall':wall, 'requests':len(server.intervals),
+                            'parse':max(0., wall-server.busy()), 'peak_mb':peak})
+    finally:
+        server.stop()
+        BLSdatarequests.bls_quota = quota
+        for source, (rate, burst) in limits.items():
+            datarequests.setRateLimit(source, rate, burst)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return pd.DataFrame(results, columns=['scenario', 'wall', 'requests', 'parse', 'peak_mb'])
+
+def compare(results, baseline, tolerance=0.2):
+    '''
+    Compares results with a baseline run and flags scenarios whose wall time, parse time or peak memory
+    grew by more than tolerance, or that sent more requests.
+    '''
+    df = pd.merge(results, baseline, on='scenario', suffixes=('', '_baseline'))
+    df['regression'] = df.requests > df.requests_baseline
+    for c in ['wall', 'parse', 'peak_mb']:
+        df[c+'_change'] = df[c]/df[c+'_baseline']-1
+        df['regression'] |= df[c+'_change'] > tolerance
+    return df
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the fetchers against a local stand-in server.')
+    parser.add_argument('scenarios', nargs='*', help='scenario names; defaults to all')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds each response is held back')
+    parser.add_argument('--fixtures', help='response cache file to replay recorded responses from')
+    parser.add_argument('--throttle', action='store_true', help='keep the providers\' rate limits')
+    parser.add_argument('--save', help='write results to this CSV file')
+    parser.add_argument('--baseline', help='CSV file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = run(args.scenarios, args.latency, args.fixtures, args.throttle)
+    print(results.to_string(index=False))
+    if args.save:
+        results.to_csv(args.save, index=False)
+    if args.baseline:
+        comparison = compare(results, pd.read_csv(args.baseline))
+        print(comparison[['scenario', 'wall_change', 'parse_change', 'peak_mb_change', 'regression']].to_string(index=False))
+        if comparison.regression.any():
+            raise SystemExit(1)
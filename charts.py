@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 18:52:17 2026
+
+Chart drawing shared by plotBLSData and plotBEAData, and batch rendering of many charts from one
+already-fetched frame. The frame is split once with groupby, and the charts are drawn and saved in
+worker processes on the headless Agg backend.
+
+A chart spec is a dictionary with:
+    - path: output file path without extension
+    - style: 'bls' (line per location, reference line in grey) or 'bea' (line per region, dollar axis)
+    - groups: labels to draw, e.g. locations or regions. Defaults to every group in the frame.
+    - title, ylabel: chart title and y-axis label
+    - statistic: for 'bls', how the y-axis is labeled ('Unemployment Rate', 'Employment' or 'CPI')
+    - reference: for 'bls', a group drawn in grey behind the others. Defaults to 'US City Average'.
+    - formats: file formats to save. Defaults to ['png', 'eps'].
+    - dpi: resolution. Defaults to 600.
+
+Example:
+    df = getBLSData('Top 25 Metros', 'Unemployment Rate', 2005, 2015)
+    specs = [{'path':'charts/ur_{}'.format(m), 'style':'bls', 'groups':[m, 'US City Average'],
+              'statistic':'Unemployment Rate', 'title':m} for m in df.location.unique()]
+    renderCharts(df, specs, by='location', x='date', y='value')
+On Windows, call renderCharts from under if __name__ == '__main__': so worker processes can start.
+"""
+
+import os
+import multiprocessing
+from matplotlib.figure import Figure
+from matplotlib.ticker import FuncFormatter
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Number of charts rendered at once
+chart_workers = multiprocessing.cpu_count()
+
+# Y-axis labels by statistic. BLS employment is reported in thousands.
+label_treatments = {'Unemployment Rate':lambda l: format(l).split('.')[0]+'%',
+                    'Employment':lambda l: format(int(l)*1000, ',').split('.')[0],
+                    'CPI':lambda l: format(l, ',').split('.')[0]}
+
+def splitFrame(df, by, x, y):
+    '''
+    Splits a long frame into {group: (x values, y values)} in one pass, with each group sorted by x.
+    '''
+    return dict((k, (g[x].values, g[y].values)) for k, g in df.sort_values(x).groupby(by, observed=True, sort=False))
+
+def drawBLS(ax, spec, series):
+    '''
+    Draws a line per location, with the reference location in grey, and labels the y-axis for the statistic.
+    '''
+    reference = spec.get('reference', 'US City Average')
+    for label, (x, y) in series:
+        if label != reference:
+            ax.plot(x, y, label=label)
+    for label, (x, y) in series:
+        if label == reference:
+            ax.plot(x, y, c='#363737', alpha=0.3, label=label)
+    ax.set_title(spec.get('title', ''))
+    ax.set_ylabel(spec.get('ylabel', spec.get('statistic', '')))
+    if spec.get('statistic') in label_treatments:
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda l, pos: label_treatments[spec['statistic']](l)))
+    ax.legend(bbox_to_anchor=(1.05, 1), loc=2, borderaxespad=0.)
+
+def drawBEA(ax, spec, series):
+    '''
+    Draws a line per region with the y-axis in dollars.
+    '''
+    for label, (x, y) in series:
+        ax.plot(x, y, label=label)
+    # Format labels with a comma and a dollar sign at the front, and drop any decimal places
+    ax.yaxis.set_major_formatter(FuncFormatter(lambda l, pos: '$'+format(l, ',').split('.')[0]))
+    ax.set_ylabel(spec.get('ylabel', ''))
+    ax.set_title(spec.get('title', ''))
+    ax.legend(loc=0)
+
+styles = {'bls':drawBLS, 'bea':drawBEA}
+
+def selectSeries(groups, spec):
+    '''
+    Picks the groups a spec asks for, in the order it lists them, from the output of splitFrame.
+    '''
+    labels = spec.get('groups') or list(groups.keys())
+    return [(label, groups[label]) for label in labels if label in groups]
+
+def saveChart(fig, path, formats=('png', 'eps'), dpi=600):
+    '''
+    Saves a figure in each format and returns the paths written.
+    '''
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # Another worker created it first
+            pass
+    paths = []
+    for fmt in formats:
+        paths.append('{}.{}'.format(path, fmt))
+        fig.savefig(paths[-1], bbox_inches='tight', dpi=dpi)
+    return paths
+
+def _renderChart(job):
+    '''
+    Draws and saves one chart on a figure of its own, without pyplot, so it runs headless in a worker.
+    '''
+    spec, series = job
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    styles[spec.get('style', 'bls')](fig.add_subplot(111), spec, series)
+    return saveChart(fig, spec['path'], spec.get('formats', ('png', 'eps')), spec.get('dpi', 600))
+
+def renderCharts(df, specs, by='location', x='date', y='value', workers=None):
+    '''
+    Renders and saves a batch of charts from one frame. Returns the list of paths written.
+        parameters:
+            - df: long-format frame, e.g. from getBLSData or getBEAData
+            - specs: list of chart specs, see module docstring
+            - by: column whose groups become lines ('location' for BLS, 'Region' for BEA)
+            - x, y: columns plotted ('date' and 'value' for BLS, 'TimePeriod' and 'DataValue' for BEA)
+            - workers: number of worker processes. Defaults to chart_workers. 1 renders in this process.
+    '''
+    groups = splitFrame(df, by, x, y)
+    jobs = [(spec, selectSeries(groups, spec)) for spec in specs]
+
+    workers = min(workers or chart_workers, len(jobs))
+    if workers <= 1:
+        paths = [_renderChart(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            paths = pool.map(_renderChart, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    return [p for chart in paths for p in chart]
@@ -0,0 +1,395 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 09:12:40 2026
+
+Shared request layer for the ACS, BLS, BEA, PWC MoneyTree and Inc. 5000 fetchers.
+
+Requests go out over one pooled keep-alive session per provider. Each provider has a token-bucket
+rate limit (rate_limits) shared by every thread, and transient failures (connection errors, timeouts,
+429 and 5xx responses) are retried with jittered exponential backoff.
+
+Responses are kept in an on-disk cache keyed on the normalized request (method, URL, query
+parameters and POST body, with API keys left out) so that re-running a report does not
+re-download data that only changes on the agencies' release schedules. Bodies are stored
+zlib-compressed in a single SQLite file, and the least recently used entries are evicted
+once the cache grows past max_bytes.
+
+Cache modes, passed as mode= to get() and post():
+    - 'ttl': serve a cached response while it is younger than the source's TTL; refresh it only once stale (default)
+    - 'refresh': always re-download and replace the cached response
+    - 'offline': serve any cached response regardless of age; only download when nothing is cached
+    - 'off': bypass the cache entirely
+
+Instrumentation: functions added with addHook() (or for a block, with instrument()) receive an event dictionary
+    - for every request: event='request', source, method, endpoint (URL without the query), status, bytes,
+      latency (seconds), retries, cache ('hit', 'miss' or 'bypass') and error, if the request failed
+    - for every fetcher stage: event='stage', source, fetcher, stage ('fetch', 'parse' or 'assemble') and seconds
+Every event also has time, the Unix time it was emitted. JSONLinesExporter writes events to a file.
+Example:
+    with instrument(JSONLinesExporter('refresh.jsonl')):
+        getBLSData('Top 25 Metros', 'Unemployment Rate', 2010, 2015)
+"""
+
+import os
+import json
+import time
+import random
+import zlib
+import sqlite3
+import hashlib
+import threading
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+try:
+    from urllib.parse import urlsplit, parse_qsl, urlencode
+except ImportError:
+    from urlparse import urlsplit, parse_qsl
+    from urllib import urlencode
+
+data_dir = os.environ.get('DATA_COLLECTION_DIR', os.path.join(os.path.expanduser('~'), '.datacollection'))
+
+# Days a cached response stays fresh, by source
+ttl_days = {'census':30, 'bls':1, 'bea':7, 'pwc':7, 'inc':30}
+# Request parameters that identify the user rather than the data, left out of cache keys
+auth_params = ['key', 'UserID', 'registrationKey']
+
+# Requests per second and burst size allowed for each provider
+rate_limits = {'census':(10, 20), 'bls':(5, 5), 'bea':(1.5, 5), 'pwc':(4, 4), 'inc':(5, 5)}
+# Connections kept open per host
+pool_size = 10
+# Seconds to wait for a response before treating it as a transient failure
+timeout = 60
+# Retries after the first attempt, and backoff base and cap in seconds
+max_retries = 4
+backoff = 0.5
+max_backoff = 30
+retry_status = [429, 500, 502, 503, 504]
+# Stand-in servers that replace a provider's servers, by source. See redirect().
+endpoints = {}
+
+class TokenBucket(object):
+    '''
+    Thread-safe token bucket. acquire() blocks until a token is available.
+        parameters:
+            - rate: tokens added per second
+            - capacity: most tokens that can accumulate, i.e. the largest burst
+    '''
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last = time.time()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens+(now-self.last)*self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1-self.tokens)/self.rate
+            time.sleep(wait)
+
+_sessions, _buckets = {}, {}
+_transport_lock = threading.Lock()
+
+def session(source):
+    '''
+    Returns the pooled keep-alive session and rate limiter for a provider, creating them on first use.
+    '''
+    with _transport_lock:
+        if source not in _sessions:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            s.mount('http://', adapter)
+            s.mount('https://', adapter)
+            _sessions[source] = s
+            _buckets[source] = TokenBucket(*rate_limits.get(source, (1, 1)))
+        return _sessions[source], _buckets[source]
+
+def setRateLimit(source, rate, burst=None):
+    '''
+    Changes a provider's rate limit (requests per second) for the rest of the session.
+    '''
+    rate_limits[source] = (rate, burst or max(1, rate))
+    with _transport_lock:
+        _buckets[source] = TokenBucket(*rate_limits[source])
+
+def redirect(source, base_url=None):
+    '''
+    Sends a provider's requests to a stand-in server, such as the local server in benchmark.py, instead of
+    the provider. The original scheme, host and path are kept in the new path, so that
+    http://api.census.gov/data/2014/acs5 becomes <base_url>/http/api.census.gov/data/2014/acs5.
+    Cache keys still use the original URL. Pass base_url=None to send requests to the provider again.
+    '''
+    if base_url is None:
+        endpoints.pop(source, None)
+    else:
+        endpoints[source] = base_url.rstrip('/')
+
+def _send(method, source, url, params=None, data=None, headers=None):
+    '''
+    Sends a request over the provider's session, within its rate limit, retrying transient failures.
+    Returns the response and the number of retries it took. An exception raised out of it carries the
+    number of retries made before it in a retries attribute.
+    '''
+    if source in endpoints:
+        parts = urlsplit(url)
+        url = '/'.join([endpoints[source], parts.scheme, parts.netloc+parts.path]) + ('?'+parts.query if parts.query else '')
+    s, bucket = session(source)
+    attempt = 0
+    while True:
+        bucket.acquire()
+        try:
+            p = s.request(method, url, params=params, data=data, headers=headers, timeout=timeout)
+            if p.status_code not in retry_status or attempt >= max_retries:
+                return p, attempt
+            wait = p.headers.get('Retry-After')
+            wait = float(wait) if wait and wait.isdigit() else None
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= max_retries:
+                e.retries = attempt
+                raise
+            wait = None
+        except Exception as e:
+            # Not retried
+            e.retries = attempt
+            raise
+        # Full jitter: sleep a random time up to the exponential backoff
+        time.sleep(wait if wait is not None else random.uniform(0, min(max_backoff, backoff*2**attempt)))
+        attempt += 1
+
+hooks = []
+_hooks_lock = threading.Lock()
+
+def addHook(hook):
+    '''
+    Registers a function to be called with every instrumentation event. See module docstring.
+    '''
+    with _hooks_lock:
+        hooks.append(hook)
+
+def removeHook(hook):
+    with _hooks_lock:
+        if hook in hooks:
+            hooks.remove(hook)
+
+@contextmanager
+def instrument(hook):
+    '''
+    Sends instrumentation events to hook for the duration of a with block.
+    '''
+    addHook(hook)
+    try:
+        yield hook
+    finally:
+        removeHook(hook)
+        if hasattr(hook, 'close'):
+            hook.close()
+
+def emit(event, **fields):
+    '''
+    Sends an event to every registered hook. A failing hook never interrupts a fetch.
+    '''
+    if not hooks:
+        return
+    fields['event'] = event
+    fields['time'] = time.time()
+    for hook in list(hooks):
+        try:
+            hook(fields)
+        except Exception:
+            pass
+
+@contextmanager
+def stage(source, fetcher, name):
+    '''
+    Times a stage of a fetcher ('fetch', 'parse' or 'assemble') and emits it as a stage event.
+    '''
+    start = time.time()
+    try:
+        yield
+    finally:
+        emit('stage', source=source, fetcher=fetcher, stage=name, seconds=time.time()-start)
+
+class JSONLinesExporter(object):
+    '''
+    Instrumentation hook that appends each event to a file as one line of JSON.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def __call__(self, event):
+        line = json.dumps(event, default=str)
+        with self._lock:
+            self._file.write(line+'\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+def requestKey(method, url, params=None, data=None):
+    '''
+    Builds the cache key for a request. Query parameters and form fields are sorted and
+    JSON bodies are re-serialized with sorted keys, so equivalent requests share a key.
+    '''
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    if params:
+        query += list(params.items()) if isinstance(params, dict) else list(params)
+    query = sorted((k, str(v)) for k, v in query if k not in auth_params)
+
+    if isinstance(data, dict):
+        body = urlencode(sorted((k, str(v)) for k, v in data.items() if k not in auth_params))
+    elif data:
+        try:
+            body = json.loads(data)
+            if isinstance(body, dict):
+                body = dict((k, v) for k, v in body.items() if k not in auth_params)
+            body = json.dumps(body, sort_keys=True)
+        except ValueError:
+            body = data
+    else:
+        body = ''
+
+    normalized = '\n'.join([method.upper(), parts.scheme.lower(), parts.netloc.lower(), parts.path,
+                            urlencode(query), body])
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+class CachedResponse(object):
+    '''
+    The parts of a requests.Response the fetchers use, whether it came from the network or the cache.
+    '''
+    def __init__(self, url, status_code, content, encoding=None, from_cache=False):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding or 'utf-8'
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, 'replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+class ResponseCache(object):
+    '''
+    On-disk store of compressed response bodies, with per-source TTLs and size-bounded LRU eviction.
+        parameters:
+            - path: SQLite file holding the cache
+            - max_bytes: compressed size above which the least recently used responses are evicted
+    '''
+    def __init__(self, path=None, max_bytes=2*1024**3):
+        self.path = path or os.path.join(data_dir, 'responses.sqlite')
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, source TEXT, url TEXT,
+                                  status INTEGER, encoding TEXT, body BLOB, size INTEGER, stored REAL, accessed REAL)''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)')
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key, source, mode='ttl'):
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT url, status, encoding, body, stored FROM responses WHERE key=?', (key,)).fetchone()
+            if row is None:
+                return None
+            url, status, encoding, body, stored = row
+            if mode == 'ttl' and time.time()-stored > ttl_days.get(source, 1)*86400:
+                return None
+            conn.execute('UPDATE responses SET accessed=? WHERE key=?', (time.time(), key))
+            conn.commit()
+        return CachedResponse(url, status, zlib.decompress(body), encoding, from_cache=True)
+
+    def put(self, key, source, response):
+        body = zlib.compress(response.content, 6)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (key, source, response.url, response.status_code, response.encoding,
+                          sqlite3.Binary(body), len(body), now, now))
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn):
+        total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in conn.execute('SELECT key, size FROM responses ORDER BY accessed'):
+            stale.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        conn.executemany('DELETE FROM responses WHERE key=?', stale)
+
+    def clear(self, source=None):
+        with self._lock:
+            conn = self._connect()
+            if source is None:
+                conn.execute('DELETE FROM responses')
+            else:
+                conn.execute('DELETE FROM responses WHERE source=?', (source,))
+            conn.commit()
+
+cache = ResponseCache()
+
+def request(method, source, url, params=None, data=None, headers=None, mode='ttl', cache_if=None):
+    '''
+    Makes a request through the response cache.
+        parameters:
+            - method: 'GET' or 'POST'
+            - source: provider the request goes to ('census', 'bls', 'bea', 'pwc', 'inc'); sets the TTL
+            - url, params, data, headers: as for requests
+            - mode: cache mode ('ttl', 'refresh', 'offline', 'off'). See module docstring.
+            - cache_if: optional function of the response returning whether it may be cached.
+                Successful HTTP responses are cached by default; use this for APIs that report errors in the body.
+    '''
+    start = time.time()
+    endpoint = url.split('?')[0]
+    key = requestKey(method, url, params, data)
+    if mode in ['ttl', 'offline']:
+        cached = cache.get(key, source, mode)
+        if cached is not None:
+            emit('request', source=source, method=method, endpoint=endpoint, status=cached.status_code, bytes=len(cached.content),
+                 latency=time.time()-start, retries=0, cache='hit')
+            return cached
+
+    try:
+        p, retries = _send(method, source, url, params=params, data=data, headers=headers)
+    except Exception as e:
+        emit('request', source=source, method=method, endpoint=endpoint, status=None, bytes=0,
+             latency=time.time()-start, retries=getattr(e, 'retries', 0), cache='miss' if mode in ['ttl', 'offline'] else 'bypass', error=repr(e))
+        raise
+    response = CachedResponse(p.url, p.status_code, p.content, p.encoding)
+    emit('request', source=source, method=method, endpoint=endpoint, status=p.status_code, bytes=len(p.content),
+         latency=time.time()-start, retries=retries, cache='miss' if mode in ['ttl', 'offline'] else 'bypass')
+
+    if mode != 'off' and p.status_code == 200 and (cache_if is None or cache_if(response)):
+        cache.put(key, source, response)
+
+    return response
+
+def get(source, url, params=None, headers=None, mode='ttl', cache_if=None):
+    return request('GET', source, url, params=params, headers=headers, mode=mode, cache_if=cache_if)
+
+def post(source, url, data=None, headers=None, mode='ttl', cache_if=None):
+    return request('POST', source, url, data=data, headers=headers, mode=mode, cache_if=cache_if)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 15:20:33 2026
+
+Geography crosswalk shared by the ACS, BLS and BEA requests. geography.csv has one row per
+geography (the US, states, metros and CPI areas) with:
+    - geo_type: 'us', 'state', 'msa' or 'cpi'
+    - state_fips: two-digit state FIPS code (for metros, the state BLS files the metro under)
+    - cbsa: CBSA code, as used by ACS (msa) and BEA (GeoFips)
+    - bls_area: area code in BLS LAUS and CES series IDs. Same as cbsa except for New England NECTAs.
+    - name: name BLS series are reported under
+    - principal_city: short metro name, as in BEA's Region field
+    - state: postal abbreviation
+    - cpi_area: BLS CPI area code
+    - top25: 1 for the 25 metros in the EAGB peer group
+
+The metro rows are not the full CBSA delineation: they are the 54 largest metros (the 25 EAGB peers and
+the next largest outside New England), which BLSdatarequests.buildSeries offers as 'Large Metros'.
+Metros are added by appending rows from the Census CBSA delineation file, with no code changes.
+
+Sources are joined on the integer CBSA or state FIPS keys rather than by parsing names. The warehouse
+keys every source's geographies the same way, with geoKeys: two-digit state FIPS ('00' for the US)
+and five-digit CBSA codes for metros.
+Example:
+    df = crosswalk.join(getBEAData('RegionalData', 'GMP'), on='GeoFips', fields=['principal_city', 'top25'])
+    top25 = crosswalk.peerGroup('top25')
+"""
+
+import os
+import pandas as pd
+
+class Crosswalk(object):
+    '''
+    Indexed view of geography.csv, loaded on first use. Name columns are categorical; metros are indexed
+    by integer CBSA code and states by integer FIPS code.
+    '''
+    categorical = ['geo_type', 'name', 'principal_city', 'state']
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'geography.csv')
+        self._table = None
+        self._index = {}
+
+    @property
+    def table(self):
+        if self._table is None:
+            table = pd.read_csv(self.path, dtype=str).fillna('')
+            for c in self.categorical:
+                table[c] = table[c].astype('category')
+            self._table = table
+        return self._table
+
+    def index(self, geo_type='msa'):
+        '''
+        Returns the rows of one geography type indexed by their integer key: CBSA for 'msa',
+        state FIPS for 'state', and CPI area code for 'cpi'.
+        '''
+        if geo_type not in self._index:
+            rows = self.table[self.table.geo_type==geo_type]
+            if geo_type == 'msa':
+                rows = rows.set_index(rows.cbsa.astype(int))
+            elif geo_type == 'state':
+                rows = rows.set_index(rows.state_fips.astype(int))
+            else:
+                rows = rows.set_index('cpi_area', drop=False)
+            self._index[geo_type] = rows
+        return self._index[geo_type]
+
+    def lookup(self, codes, field, geo_type='msa'):
+        '''
+        Returns the field for each code as an array, with NaN for codes not in the crosswalk.
+        '''
+        return self.index(geo_type)[field].reindex(codes).values
+
+    def join(self, df, on, fields, geo_type='msa'):
+        '''
+        Joins crosswalk fields onto a dataframe by an integer geography code column.
+        '''
+        index = self.index(geo_type)[fields]
+        return df.join(index, on=on)
+
+    def peerGroup(self, name='top25', geo_type='msa'):
+        '''
+        Returns the integer codes of the geographies flagged in a peer group column.
+        '''
+        index = self.index(geo_type)
+        return index.index[index[name]=='1'].values
+
+    def geoKeys(self, values, field='state', geo_type='state'):
+        '''
+        Returns the warehouse geography key for each value of a crosswalk field, e.g. postal abbreviations
+        or BLS area codes: two-digit state FIPS for states and the US, and five-digit CBSA for metros.
+        Values not in the crosswalk are kept as they are.
+        '''
+        rows = self.table[self.table.geo_type==geo_type]
+        keys = rows.cbsa if geo_type == 'msa' else rows.state_fips
+        values = pd.Series(values).astype(str)
+        return values.map(dict(zip(rows[field].astype(str), keys))).fillna(values).values
+
+crosswalk = Crosswalk()
+us_key = '00'
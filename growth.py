@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 14:02:51 2026
+
+Growth rates and ranks for any long-format series frame: getBEAData output, getBLSData output,
+or multi-year ACS frames. Every region, horizon and rank is computed in one vectorized pass.
+
+Examples:
+    getGrowth(getBEAData('RegionalData', 'GMP'), horizons=[1, 5, 10])
+    getGrowth(bls[~bls.annual], value='value', by='seriesID', period='date', horizons=[1, 5], periods_per_year=12)
+    getGrowth(acs_panel, value='value', by=['msa', 'indicator'], period='year', horizons=[1, 5])
+"""
+
+import pandas as pd
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+# Columns of by that name a series rather than a region. Ranks are taken within each series.
+series_columns = ['indicator', 'variable', 'code', 'series', 'LineNumber']
+
+def getGrowth(df, value='DataValue', by='GeoFips', period='TimePeriod', horizons=None, periods_per_year=1, rank=True, rank_by=None):
+    '''
+    Adds growth over each horizon for every region, and optionally ranks the value and every growth
+    rate among regions within each period.
+    Rows are expected to be one per region and period with no gaps, so that a horizon of h years is
+    h*periods_per_year rows back within the region.
+    parameters:
+        - df: long-format dataframe with one row per region and period
+        - value: column holding the series value
+        - by: column or list of columns identifying a region (or region and series)
+        - period: column holding the period, used for ordering and for ranking within a period
+        - horizons: list of horizons, in years. Defaults to [1, 5, 10].
+        - periods_per_year: 1 for annual data, 4 for quarterly, 12 for monthly
+        - rank: whether to add {column}_rank columns, where 1 is the largest value in the period
+        - rank_by: columns that identify a series, so that regions are ranked within each period and series.
+            Defaults to the columns of by listed in series_columns, e.g. indicator in an ACS panel.
+    Returns a copy of df sorted by region and period, with a {value}_{h}yeargrowth column per horizon.
+    '''
+    by = [by] if isinstance(by, string_types) else list(by)
+    horizons = [1, 5, 10] if horizons is None else horizons
+    if rank_by is None:
+        rank_by = [c for c in by if c in series_columns]
+    else:
+        rank_by = [rank_by] if isinstance(rank_by, string_types) else list(rank_by)
+    df = df.sort_values(by+[period]).reset_index(drop=True)
+
+    grouped = df.groupby(by, sort=False)[value]
+    columns = [value]
+    for h in horizons:
+        column = '{value}_{h}yeargrowth'.format(value=value, h=h)
+        df[column] = df[value]/grouped.shift(int(h*periods_per_year)) - 1
+        columns.append(column)
+
+    if rank:
+        ranks = df.groupby([period]+rank_by, observed=True)[columns].rank(ascending=False)
+        for c in columns:
+            df[c+'_rank'] = ranks[c]
+
+    return df
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 20:07:39 2026
+
+Runs a manifest of pulls and derived steps as a job graph. Jobs whose inputs are ready run concurrently,
+so pulls from different providers overlap, and each provider's rate limit in datarequests still applies.
+
+A manifest is JSON, or YAML when PyYAML is installed:
+    {"output_dir": "reports/2015",
+     "workers": 4,
+     "jobs": {
+        "unemployment": {"call": "BLSdatarequests.getBLSData", "args": ["Top 25 Metros", "Unemployment Rate", 2013, 2015]},
+        "gmp": {"call": "BEAdatarequests.getBEAData", "args": ["RegionalData", "GMP"]},
+        "gmp_growth": {"call": "growth.getGrowth", "args": ["$gmp"], "kwargs": {"horizons": [1, 5]}, "format": "parquet"},
+        "gmp_5year": {"call": "BEAdatarequests.get5Yeargrowth", "args": ["GMP"]},
+        "gmp_5year_top25": {"call": "growth.getGrowth", "args": ["$gmp_5year[1]"], "kwargs": {"value": "GMP", "horizons": [1]}}
+     }}
+
+Each job calls a function in one of job_modules with args and kwargs. Any argument written as "$job" is
+replaced by that job's result ("$job[0]" or "$job[key]" picks one item of a tuple or dictionary result),
+and makes the job wait for it. Modules are imported when a job first needs them, so a headless run
+never loads the plotting libraries unless it draws a chart.
+
+Results are written to output_dir: a dataframe to <job>.csv (or the job's "format": csv, parquet or json),
+a tuple, list or dictionary of dataframes to one file per item, and a figure to <job>.png.
+Set "output": false on a job to keep its result in memory only.
+
+Usage:
+    python runner.py manifest.json [--jobs gmp_growth] [--output-dir out] [--workers 8] [--events events.jsonl]
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import importlib
+import pandas as pd
+import datarequests
+from multiprocessing.dummy import Pool as ThreadPool
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+# Modules whose functions a manifest may call
+job_modules = ['ACSdatarequests', 'BLSdatarequests', 'BEAdatarequests', 'PWCMoneyTree', 'Inc5000_scraper',
+               'growth', 'charts', 'warehouse']
+# Jobs run at once
+runner_workers = 4
+# Formats a dataframe result can be written in
+output_formats = ['csv', 'parquet', 'json']
+
+_reference = re.compile(r'^\$(\w+)(?:\[([^\]]+)\])?$')
+
+def loadManifest(path):
+    '''
+    Reads a JSON or YAML manifest.
+    '''
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def _references(value):
+    '''
+    Yields the names of the jobs a job argument refers to.
+    '''
+    if isinstance(value, dict):
+        for v in value.values():
+            for name in _references(v):
+                yield name
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            for name in _references(v):
+                yield name
+    elif isinstance(value, string_types) and _reference.match(value):
+        yield _reference.match(value).group(1)
+
+def _resolve(value, results):
+    '''
+    Replaces job references in an argument with the jobs' results.
+    '''
+    if isinstance(value, dict):
+        return dict((k, _resolve(v, results)) for k, v in value.items())
+    elif isinstance(value, list):
+        return [_resolve(v, results) for v in value]
+    elif isinstance(value, string_types) and _reference.match(value):
+        name, item = _reference.match(value).groups()
+        result = results[name]
+        if item is None:
+            return result
+        return result[int(item)] if item.isdigit() and isinstance(result, (list, tuple)) else result[item]
+    return value
+
+def dependencies(jobs):
+    '''
+    Returns {job: set of jobs it needs}, and raises ValueError for unknown jobs, unknown output formats and cycles.
+    '''
+    needs = dict((name, set(_references([job.get('args', []), job.get('kwargs', {})]))) for name, job in jobs.items())
+    for name, deps in needs.items():
+        unknown = deps - set(jobs)
+        if unknown:
+            raise ValueError('Job {} refers to unknown jobs: {}'.format(name, ', '.join(sorted(unknown))))
+        if jobs[name].get('format', 'csv') not in output_formats:
+            raise ValueError('Job {} has an unknown format {!r}; use one of {}'.format(name, jobs[name]['format'], ', '.join(output_formats)))
+    ordered, remaining = set(), dict(needs)
+    while remaining:
+        ready = [name for name, deps in remaining.items() if deps <= ordered]
+        if not ready:
+            raise ValueError('Jobs depend on each other in a cycle: {}'.format(', '.join(sorted(remaining))))
+        ordered.update(ready)
+        for name in ready:
+            del remaining[name]
+    return needs
+
+def writeOutput(result, path, fmt='csv'):
+    '''
+    Writes a job result to path (without extension) and returns the paths written.
+    '''
+    if fmt not in output_formats:
+        raise ValueError('Unknown format {!r}; use one of {}'.format(fmt, ', '.join(output_formats)))
+    if isinstance(result, pd.DataFrame):
+        if fmt == 'parquet':
+            result.to_parquet(path+'.parquet')
+        elif fmt == 'json':
+            result.to_json(path+'.json', orient='records', date_format='iso')
+        else:
+            result.to_csv(path+'.csv', index=False)
+        return [path+'.'+fmt]
+    elif isinstance(result, dict):
+        return [p for k, v in result.items() for p in writeOutput(v, '{}_{}'.format(path, k), fmt)]
+    elif isinstance(result, (list, tuple)):
+        return [p for i, v in enumerate(result) for p in writeOutput(v, '{}_{}'.format(path, i), fmt)]
+    elif hasattr(result, 'savefig'):
+        result.savefig(path+'.png', bbox_inches='tight')
+        return [path+'.png']
+    return []
+
+def _runJob(name, job, args, kwargs, output_dir):
+    '''
+    Calls one job's function and writes its output. Returns (name, result, error, seconds, paths).
+    '''
+    start = time.time()
+    try:
+        module, function = job['call'].rsplit('.', 1)
+        if module not in job_modules:
+            raise ValueError('{} is not one of the job modules: {}'.format(module, ', '.join(job_modules)))
+        result = getattr(importlib.import_module(module), function)(*args, **kwargs)
+        paths = []
+        if job.get('output', True) and output_dir:
+            paths = writeOutput(result, os.path.join(output_dir, name), job.get('format', 'csv'))
+        return name, result, None, time.time()-start, paths
+    except Exception as e:
+        return name, None, e, time.time()-start, []
+
+def run(manifest, jobs=None, output_dir=None, workers=None):
+    '''
+    Runs the jobs in a manifest, each as soon as the jobs it refers to have finished. Jobs that depend
+    on a failed job are skipped. Returns ({job: result}, {job: error}).
+        parameters:
+            - manifest: manifest dictionary, or the path of a JSON or YAML manifest
+            - jobs: names of the jobs to run, along with the jobs they need. Defaults to every job.
+            - output_dir: where results are written. Defaults to the manifest's output_dir.
+            - workers: jobs run at once. Defaults to the manifest's workers, then runner_workers.
+    '''
+    if not isinstance(manifest, dict):
+        manifest = loadManifest(manifest)
+    needs = dependencies(manifest['jobs'])
+    output_dir = output_dir or manifest.get('output_dir')
+    workers = workers or manifest.get('workers', runner_workers)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Only the requested jobs and everything they need
+    wanted = set(jobs or needs)
+    unknown = wanted - set(needs)
+    if unknown:
+        raise ValueError('Jobs not in the manifest: {}'.format(', '.join(sorted(unknown))))
+    stack = list(wanted)
+    while stack:
+        for dep in needs[stack.pop()]:
+            if dep not in wanted:
+                wanted.add(dep)
+                stack.append(dep)
+    pending = sorted(wanted)
+
+    results, errors = {}, {}
+    finished = Queue()
+    pool = ThreadPool(workers)
+    running = 0
+    try:
+        while pending or running:
+            for name in list(pending):
+                if needs[name] & set(errors):
+                    errors[name] = 'skipped: needs {}'.format(', '.join(sorted(needs[name] & set(errors))))
+                    pending.remove(name)
+                elif needs[name] <= set(results):
+                    job = manifest['jobs'][name]
+                    args = _resolve(job.get('args', []), results)
+                    kwargs = _resolve(job.get('kwargs', {}), results)
+                    pool.apply_async(_runJob, (name, job, args, kwargs, output_dir), callback=finished.put)
+                    pending.remove(name)
+                    running += 1
+            if not running:
+                break
+
+            name, result, error, seconds, paths = finished.get()
+            running -= 1
+            if error is not None:
+                errors[name] = error
+                print('{} failed after {:.1f}s: {!r}'.format(name, seconds, error))
+            else:
+                results[name] = result
+                print('{} finished in {:.1f}s{}'.format(name, seconds, ': '+', '.join(paths) if paths else ''))
+    finally:
+        pool.close()
+
+    return results, errors
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a manifest of data pulls and derived steps.')
+    parser.add_argument('manifest', help='JSON or YAML manifest')
+    parser.add_argument('--jobs', nargs='*', help='jobs to run, with the jobs they need; defaults to all')
+    parser.add_argument('--output-dir', help='where results are written; overrides the manifest')
+    parser.add_argument('--workers', type=int, help='jobs run at once')
+    parser.add_argument('--events', help='write request and stage timings to this JSON lines file')
+    args = parser.parse_args()
+
+    if args.events:
+        datarequests.addHook(datarequests.JSONLinesExporter(args.events))
+    results, errors = run(args.manifest, args.jobs, args.output_dir, args.workers)
+    if errors:
+        raise SystemExit(1)
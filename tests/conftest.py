@@ -0,0 +1,28 @@
+import os
+import sys
+import pytest
+
+# Modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def stand_in(tmpdir, monkeypatch):
+    '''
+    Starts the benchmark stand-in server with no latency, redirects every provider to it, and gives the test
+    its own response cache and BLS quota. Yields the server, whose size sets the synthetic payloads.
+    '''
+    import benchmark
+    import datarequests
+    import BLSdatarequests
+    monkeypatch.setattr(datarequests, 'cache', datarequests.ResponseCache(str(tmpdir.join('responses.sqlite'))))
+    monkeypatch.setattr(BLSdatarequests, 'bls_quota', BLSdatarequests.BLSQuota(str(tmpdir.join('bls_quota.json'))))
+    limits = dict(datarequests.rate_limits)
+    for source in benchmark.sources:
+        datarequests.setRateLimit(source, 1e6)
+    server = benchmark.StandInServer(latency=0, size=10).start()
+    try:
+        yield server
+    finally:
+        server.stop()
+        for source, (rate, burst) in limits.items():
+            datarequests.setRateLimit(source, rate, burst)
@@ -0,0 +1,23 @@
+import ACSdatarequests
+
+# More series than fit in one call, so the frame is assembled from two
+variables = ['DP03_00{:02d}E'.format(i) for i in range(1, 61)]
+
+def test_wide_frame_has_a_column_per_series(stand_in):
+    df = ACSdatarequests.getACSData(variables, 'msa', 2014, cache='off')
+
+    assert len(stand_in.intervals) == 2
+    assert len(df) == stand_in.size and not df.msa.duplicated().any()
+    assert df.columns[0] == 'NAME' and set(variables) <= set(df.columns)
+    assert df[variables].notnull().all().all()
+
+def test_long_frame_matches_wide_frame(stand_in):
+    wide = ACSdatarequests.getACSData(variables, 'msa', 2014)
+    # From the response cache, so both shapes are built from the same responses
+    long = ACSdatarequests.getACSData(variables, 'msa', 2014, shape='long')
+
+    assert len(stand_in.intervals) == 2
+    assert len(long) == stand_in.size*len(variables)
+    assert list(long.columns[-2:]) == ['variable', 'value'] and not set(variables) & set(long.columns)
+    pivoted = long.pivot(index='msa', columns='variable', values='value')
+    assert (pivoted[variables].values == wide.set_index('msa').loc[pivoted.index, variables].astype(float).values).all()
@@ -0,0 +1,11 @@
+import BEAdatarequests
+
+def test_batch_mixes_nipa_tables_and_regional_keycodes(stand_in):
+    df = BEAdatarequests.getBEABatch(tables=['T10101'], keycodes=['GMP'], first_year=2012, last_year=2014, cache='off')
+
+    nipa = df[df.dataset=='NIPA']
+    regional = df[df.dataset=='RegionalData']
+    assert len(nipa) == 10*3 and len(regional) == 10*14
+    # NIPA rows have no geography; regional rows are named from the crosswalk
+    assert nipa.GeoFips.isnull().all() and nipa.Region.isnull().all()
+    assert regional.Region.notnull().all()
@@ -0,0 +1,31 @@
+import BLSdatarequests
+from BLSdatarequests import planBLSQueries, bls_limits
+
+def blsSeries(n):
+    return dict(('LAUMT{:02d}{:05d}00000003'.format(i%50+1, 10000+i), 'Area {}'.format(i)) for i in range(n))
+
+def test_plan_splits_series_and_years_to_the_limits(monkeypatch):
+    monkeypatch.setattr(BLSdatarequests, 'BLS_key', '')
+    series = sorted(blsSeries(60))
+
+    queries = planBLSQueries(series, 2000, 2014)
+
+    assert [(len(s), first, last) for s, first, last in queries] == [(25, 2000, 2009), (25, 2000, 2009), (10, 2000, 2009),
+                                                                     (25, 2010, 2014), (25, 2010, 2014), (10, 2010, 2014)]
+    # Every series is asked for once per span of years
+    assert sorted(sum([s for s, first, last in queries if first == 2000], [])) == series
+
+def test_plan_uses_registered_limits_with_a_key(monkeypatch):
+    monkeypatch.setattr(BLSdatarequests, 'BLS_key', 'registered')
+    queries = planBLSQueries(sorted(blsSeries(60)), 1995, 2014)
+    assert [(len(s), first, last) for s, first, last in queries] == [(50, 1995, 2014), (10, 1995, 2014)]
+
+def test_split_queries_are_stitched_back_together(stand_in, monkeypatch):
+    monkeypatch.setattr(BLSdatarequests, 'BLS_key', '')
+    series = blsSeries(60)
+
+    df = BLSdatarequests.getBLSData('Other', 'Other', 2000, 2014, series_dict=series, cache='off')
+
+    assert len(stand_in.intervals) == len(planBLSQueries(series, 2000, 2014))
+    assert len(df) == 60*15*12 and set(df.location) == set(series.values())
+    assert not df.duplicated(['seriesID', 'date']).any()
@@ -0,0 +1,54 @@
+import BLSdatarequests
+from BLSdatarequests import BLSHistory
+
+def fakeSeries(calls):
+    '''
+    Stands in for fetchBLSSeries: records each request and returns a monthly value for every year asked for.
+    '''
+    def fetch(series, first_year, last_year, ann_avg='false', cache='ttl'):
+        calls.append((sorted(series), first_year, last_year, ann_avg))
+        return [{'seriesID':sid, 'data':[{'year':str(y), 'period':'M01', 'periodName':'January', 'value':'1.0'}
+                                         for y in range(first_year, last_year+1)]} for sid in series]
+    return fetch
+
+def test_sync_fetches_years_before_stored_range(tmpdir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(BLSdatarequests, 'fetchBLSSeries', fakeSeries(calls))
+    history = BLSHistory(str(tmpdir.join('history.sqlite')))
+    series = {'LAUMT241258000000003':'Baltimore'}
+
+    history.sync(series.keys(), 2013, 2015)
+    history.sync(series.keys(), 2005, 2015)
+
+    assert calls == [(['LAUMT241258000000003'], 2013, 2015, 'false'),
+                     (['LAUMT241258000000003'], 2005, 2012, 'false'),
+                     (['LAUMT241258000000003'], 2014, 2015, 'false')]
+    assert history.coverage(list(series)) == {'LAUMT241258000000003':(2005, 2015)}
+    assert sorted(history.read(series, 2005, 2015).date.dt.year.unique()) == list(range(2005, 2016))
+
+def test_sync_tracks_annual_averages_separately(tmpdir, monkeypatch):
+    calls = []
+    monkeypatch.setattr(BLSdatarequests, 'fetchBLSSeries', fakeSeries(calls))
+    history = BLSHistory(str(tmpdir.join('history.sqlite')))
+
+    history.sync(['LAUMT241258000000003'], 2013, 2015, ann_avg='false')
+    history.sync(['LAUMT241258000000003'], 2013, 2015, ann_avg='true')
+
+    assert calls[-1] == (['LAUMT241258000000003'], 2013, 2015, 'true')
+
+def test_read_leaves_out_annual_averages_unless_asked(tmpdir, monkeypatch):
+    def fetch(series, first_year, last_year, ann_avg='false', cache='ttl'):
+        periods = [('M01', 'January'), ('M13', 'Annual')] if ann_avg == 'true' else [('M01', 'January')]
+        return [{'seriesID':sid, 'data':[{'year':str(y), 'period':p, 'periodName':n, 'value':'1.0'}
+                                         for y in range(first_year, last_year+1) for p, n in periods]} for sid in series]
+    monkeypatch.setattr(BLSdatarequests, 'fetchBLSSeries', fetch)
+    history = BLSHistory(str(tmpdir.join('history.sqlite')))
+    series = {'LAUMT241258000000003':'Baltimore'}
+
+    history.sync(series.keys(), 2014, 2015, ann_avg='true')
+    history.sync(series.keys(), 2014, 2015, ann_avg='false')
+
+    monthly = history.read(series, 2014, 2015, ann_avg='false')
+    assert not monthly.annual.any()
+    assert monthly.date.is_unique
+    assert history.read(series, 2014, 2015, ann_avg='true').annual.sum() == 2
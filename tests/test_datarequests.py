@@ -0,0 +1,71 @@
+import os
+import time
+import datarequests
+from datarequests import ResponseCache, CachedResponse
+
+census_url = 'http://api.census.gov/data/2014/acs5/profile'
+census_params = {'get':'NAME,DP03_0001E', 'for':'state:*'}
+
+def test_cache_serves_fresh_responses_until_they_expire(stand_in, monkeypatch):
+    first = datarequests.get('census', census_url, params=census_params)
+    second = datarequests.get('census', census_url, params=census_params)
+    assert len(stand_in.intervals) == 1
+    assert second.from_cache and second.content == first.content
+
+    # Past its TTL a response is fetched again, but offline mode still serves it
+    monkeypatch.setitem(datarequests.ttl_days, 'census', 0)
+    time.sleep(0.01)
+    assert datarequests.get('census', census_url, params=census_params, mode='offline').from_cache
+    assert len(stand_in.intervals) == 1
+    assert not datarequests.get('census', census_url, params=census_params).from_cache
+    assert len(stand_in.intervals) == 2
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    cache = ResponseCache(str(tmpdir.join('responses.sqlite')), max_bytes=2500)
+    # Random bodies do not compress, so each takes about 1000 bytes
+    for key in ['a', 'b']:
+        cache.put(key, 'census', CachedResponse('http://example.com/'+key, 200, os.urandom(1000)))
+        time.sleep(0.01)
+    cache.get('a', 'census')
+    time.sleep(0.01)
+    cache.put('c', 'census', CachedResponse('http://example.com/c', 200, os.urandom(1000)))
+
+    assert cache.get('b', 'census') is None
+    assert cache.get('a', 'census') is not None and cache.get('c', 'census') is not None
+
+def flaky(server, failures, calls):
+    '''
+    Wraps the stand-in server so that its first failures responses are 503s.
+    '''
+    respond = server.respond
+    def handle(method, path, body):
+        calls.append(path)
+        if len(calls) <= failures:
+            return 503, b'{}'
+        return respond(method, path, body)
+    return handle
+
+def test_request_events_count_retries(stand_in, monkeypatch):
+    calls, events = [], []
+    monkeypatch.setattr(stand_in, 'respond', flaky(stand_in, 2, calls))
+    monkeypatch.setattr(datarequests, 'backoff', 0)
+
+    with datarequests.instrument(events.append):
+        p = datarequests.get('census', census_url, params=census_params, mode='off')
+
+    assert p.status_code == 200 and len(calls) == 3
+    assert [(e['status'], e['retries']) for e in events if e['event'] == 'request'] == [(200, 2)]
+
+def test_retries_stop_at_max_retries(stand_in, monkeypatch):
+    calls, events = [], []
+    monkeypatch.setattr(stand_in, 'respond', flaky(stand_in, 100, calls))
+    monkeypatch.setattr(datarequests, 'backoff', 0)
+    monkeypatch.setattr(datarequests, 'max_retries', 2)
+
+    with datarequests.instrument(events.append):
+        p = datarequests.get('census', census_url, params=census_params)
+
+    assert p.status_code == 503 and len(calls) == 3
+    assert [(e['status'], e['retries']) for e in events if e['event'] == 'request'] == [(503, 2)]
+    # Failed responses are not cached
+    assert datarequests.cache.get(datarequests.requestKey('GET', census_url, census_params), 'census') is None
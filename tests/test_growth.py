@@ -0,0 +1,16 @@
+import pandas as pd
+from growth import getGrowth
+
+def test_ranks_within_each_series():
+    df = pd.DataFrame({'msa':[1, 1, 2, 2]*2, 'indicator':['MHHI']*4+['MedianAge']*4, 'year':[2014, 2015]*4,
+                       'value':[50000, 51000, 60000, 59000, 30, 31, 40, 41]})
+    g = getGrowth(df, value='value', by=['msa', 'indicator'], period='year', horizons=[1])
+    # Median ages are ranked against each other, not against incomes
+    assert g[g.indicator=='MedianAge'].value_rank.tolist() == [2, 2, 1, 1]
+    assert g[(g.indicator=='MedianAge') & (g.year==2015)].value_1yeargrowth_rank.tolist() == [1, 2]
+
+def test_single_column_by():
+    df = pd.DataFrame({'GeoFips':[1, 1, 2, 2], 'TimePeriod':[2014, 2015]*2, 'DataValue':[10., 11., 20., 19.]})
+    g = getGrowth(df, by=u'GeoFips', horizons=[1])
+    assert g.DataValue_1yeargrowth.round(2).tolist()[1] == 0.1
+    assert g[g.TimePeriod==2015].DataValue_1yeargrowth_rank.tolist() == [1, 2]
@@ -0,0 +1,18 @@
+import Inc5000_scraper
+
+def test_cold_crawl_keeps_several_requests_in_flight(stand_in, tmpdir):
+    stand_in.size = 40
+    stand_in.latency = 0.05
+    checkpoint = Inc5000_scraper.crawlInc5000(2015, checkpoint=str(tmpdir.join('inc.jsonl')), workers=8, cache='off')
+
+    companies = list(Inc5000_scraper.readCheckpoint(checkpoint))
+    assert sorted(c['rank'] for c in companies) == list(range(1, 41))
+    # Most requests in flight at one moment
+    starts = sorted(start for start, end in stand_in.intervals)
+    assert max(sum(1 for s, e in stand_in.intervals if s <= t < e) for t in starts) > 1
+
+def test_crawl_falls_back_to_next_id_chain(stand_in, tmpdir, monkeypatch):
+    stand_in.size = 5
+    monkeypatch.setattr(Inc5000_scraper, 'listInc5000', lambda year, cache='ttl': [])
+    checkpoint = Inc5000_scraper.crawlInc5000(2015, checkpoint=str(tmpdir.join('inc.jsonl')), cache='off')
+    assert sorted(c['rank'] for c in Inc5000_scraper.readCheckpoint(checkpoint)) == list(range(1, 6))
@@ -0,0 +1,41 @@
+import time
+import pytest
+import growth
+import runner
+
+def manifest():
+    return {'jobs':{
+        'gmp': {'call':'BEAdatarequests.getBEAData', 'args':['RegionalData', 'GMP'], 'kwargs':{'cache':'off'}},
+        'gmp_growth': {'call':'growth.getGrowth', 'args':['$gmp'], 'kwargs':{'horizons':[1]}},
+        'broken': {'call':'BEAdatarequests.noSuchFunction'},
+        'broken_growth': {'call':'growth.getGrowth', 'args':['$broken']}}}
+
+def test_dependencies_follow_references():
+    assert runner.dependencies(manifest()['jobs']) == {'gmp':set(), 'gmp_growth':{'gmp'}, 'broken':set(), 'broken_growth':{'broken'}}
+
+def test_dependencies_reject_cycles_and_unknown_jobs():
+    with pytest.raises(ValueError):
+        runner.dependencies({'a':{'call':'growth.getGrowth', 'args':['$b']}, 'b':{'call':'growth.getGrowth', 'args':['$a[0]']}})
+    with pytest.raises(ValueError):
+        runner.dependencies({'a':{'call':'growth.getGrowth', 'args':['$missing']}})
+
+def test_jobs_wait_for_the_jobs_they_need(stand_in, tmpdir, monkeypatch):
+    started = []
+    getGrowth = growth.getGrowth
+    def recordedGrowth(df, *args, **kwargs):
+        started.append(time.time())
+        return getGrowth(df, *args, **kwargs)
+    monkeypatch.setattr(growth, 'getGrowth', recordedGrowth)
+
+    results, errors = runner.run(manifest(), output_dir=str(tmpdir))
+
+    # The growth job ran on the pulled frame, after every request of the pull had been answered
+    assert started and min(started) >= max(end for start, end in stand_in.intervals)
+    assert len(results['gmp_growth']) == len(results['gmp']) and 'DataValue_1yeargrowth' in results['gmp_growth']
+    assert tmpdir.join('gmp_growth.csv').check()
+    # A failed job's dependents are skipped rather than run
+    assert set(errors) == {'broken', 'broken_growth'} and errors['broken_growth'] == 'skipped: needs broken'
+
+def test_only_requested_jobs_and_their_needs_run(stand_in):
+    results, errors = runner.run(manifest(), jobs=['gmp_growth'])
+    assert set(results) == {'gmp', 'gmp_growth'} and not errors
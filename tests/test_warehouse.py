@@ -0,0 +1,33 @@
+import pandas as pd
+import ACSdatarequests
+import BEAdatarequests
+import BLSdatarequests
+import PWCMoneyTree
+from warehouse import Warehouse
+
+def test_sources_join_on_geo(tmpdir, monkeypatch):
+    store = Warehouse(str(tmpdir.join('warehouse.sqlite')))
+
+    # ACS keys states by FIPS code
+    acs = pd.DataFrame({'NAME':['Maryland', 'Virginia'], 'DP03_0062E':['74551', '64902']},
+                       index=pd.Index([24, 51], name='state'))
+    store.write(ACSdatarequests._warehouseACS([acs], 2014), 'census')
+
+    # MoneyTree reports states by postal abbreviation
+    def fetchVC(year1, year2, industry, state, cache='ttl'):
+        return pd.DataFrame({'period':['2014-1'], 'state':[state], 'industry':[industry], 'dollars':[1e6], 'deals':[3]})
+    monkeypatch.setattr(PWCMoneyTree, '_fetchVC', fetchVC)
+    PWCMoneyTree.getVC(2014, 2014, states=['MD', 'VA'], store=store)
+
+    acs = store.query(source='census')
+    vc = store.query(source='pwc', series='All Industries/deals')
+    joined = acs.merge(vc, on='geo', suffixes=('_acs', '_vc'))
+    assert sorted(joined.geo.astype(str)) == ['24', '51']
+
+def test_metro_keys_match_across_sources():
+    bls = BLSdatarequests.parseBLSResults([{'seriesID':'LAUMT241258000000003',
+                                            'data':[{'year':'2014', 'period':'M01', 'periodName':'January', 'value':'6.0'}]}])
+    bea = pd.DataFrame({'GeoFips':[12580, 24000, None], 'TimePeriod':[2014]*3, 'DataValue':[1., 2., 3.]})
+    bea_geo = BEAdatarequests._warehouseBEA(bea, pd.Series('GMP', index=bea.index), pd.Series('A', index=bea.index)).geo
+    assert BLSdatarequests._warehouseBLS(bls).geo.tolist() == ['12580']
+    assert bea_geo.tolist() == ['12580', '24', '00']
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 18 16:41:08 2026
+
+Local store of every series the fetchers return, in one long schema:
+    - source: provider the data came from ('census', 'bls', 'bea', 'pwc', 'inc')
+    - series: series ID, variable or table line, e.g. LAUMT241258000000003, DP03_0062E or GDP_MP
+    - geo: geography key, the same for every source: two-digit state FIPS ('00' for the US), five-digit
+      CBSA for metros, and full FIPS for counties, places and tracts. See geography.Crosswalk.geoKeys.
+      Geographies outside the crosswalk, such as BLS CPI areas, keep their source's code.
+    - period: start of the period the value covers, as YYYY-MM-DD
+    - value: the observation
+    - vintage: date the observation was fetched, so revised data can sit alongside earlier releases
+
+The fetchers write into it when passed store=, and query() reads from it without the network.
+Example:
+    getBLSData('Top 25 Metros', 'Unemployment Rate', 2010, 2015, store=warehouse)
+    warehouse.query(source='bls', start='2014-01-01')
+"""
+
+import os
+import time
+import sqlite3
+import threading
+import pandas as pd
+import datarequests
+
+class Warehouse(object):
+    '''
+    SQLite store of observations in the long schema, indexed for lookups by series, by geography and by period.
+        parameters:
+            - path: SQLite file holding the store
+    '''
+    columns = ['source', 'series', 'geo', 'period', 'value', 'vintage']
+
+    def __init__(self, path=None):
+        self.path = path or os.path.join(datarequests.data_dir, 'warehouse.sqlite')
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self):
+        if self._conn is None:
+            if not os.path.exists(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('''CREATE TABLE IF NOT EXISTS observations (source TEXT, series TEXT, geo TEXT, period TEXT,
+                                  value REAL, vintage TEXT, PRIMARY KEY (source, series, geo, period, vintage))''')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS observations_geo ON observations (geo, period)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS observations_period ON observations (period)')
+            self._conn.commit()
+        return self._conn
+
+    def write(self, df, source, vintage=None):
+        '''
+        Stores a dataframe with series, geo, period and value columns, replacing any observations
+        already stored for the same vintage.
+            - df: long-format dataframe. Periods may be dates or integer years.
+            - source: provider the data came from
+            - vintage: release the data belongs to. Defaults to today's date.
+        Returns the number of observations written.
+        '''
+        vintage = vintage or time.strftime('%Y-%m-%d')
+        period = df.period
+        if pd.api.types.is_integer_dtype(period):
+            period = period.astype(str)+'-01-01'
+        period = pd.to_datetime(period).dt.strftime('%Y-%m-%d')
+        value = pd.to_numeric(df.value, errors='coerce')
+
+        rows = list(zip([source]*len(df), df.series.astype(str), df.geo.astype(str), period,
+                        value.astype(object).where(value.notnull(), None), [vintage]*len(df)))
+        with self._lock:
+            conn = self._connect()
+            conn.executemany('INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.commit()
+        return len(rows)
+
+    def query(self, source=None, series=None, geo=None, start=None, end=None, vintage=None, latest=True):
+        '''
+        Returns stored observations as a dataframe, sorted by source, series, geo and period.
+        Every filter is optional. source, series, geo and vintage take a single value or a list.
+            - start, end: first and last period to return, as dates or 'YYYY-MM-DD'
+            - vintage: only return these vintages
+            - latest: keep only the most recent vintage of each observation
+        '''
+        where, params = [], []
+        for column, values in [('source', source), ('series', series), ('geo', geo), ('vintage', vintage)]:
+            if values is None:
+                continue
+            values = [str(v) for v in values] if isinstance(values, (list, tuple, set)) else [str(values)]
+            where.append('{} IN ({})'.format(column, ','.join('?'*len(values))))
+            params += values
+        for op, bound in [('>=', start), ('<=', end)]:
+            if bound is not None:
+                where.append('period {} ?'.format(op))
+                params.append(pd.Timestamp(bound).strftime('%Y-%m-%d'))
+
+        sql = 'SELECT source, series, geo, period, value, vintage FROM observations'
+        if where:
+            sql += ' WHERE '+' AND '.join(where)
+        sql += ' ORDER BY source, series, geo, period, vintage'
+        with self._lock:
+            df = pd.read_sql_query(sql, self._connect(), params=params)
+
+        if latest:
+            df = df.drop_duplicates(['source', 'series', 'geo', 'period'], keep='last').reset_index(drop=True)
+        df['period'] = pd.to_datetime(df.period)
+        for c in ['source', 'series', 'geo']:
+            df[c] = df[c].astype('category')
+        return df
+
+    def delete(self, source=None, vintage=None):
+        '''
+        Removes stored observations for a source, a vintage, or both.
+        '''
+        where = [(c, v) for c, v in [('source', source), ('vintage', vintage)] if v is not None]
+        sql = 'DELETE FROM observations'
+        if where:
+            sql += ' WHERE '+' AND '.join('{}=?'.format(c) for c, v in where)
+        with self._lock:
+            conn = self._connect()
+            conn.execute(sql, [v for c, v in where])
+            conn.commit()
+
+warehouse = Warehouse()